@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+#
+# Test cases for application.py
+#
+# Runs the app against a scratch SQLite database and counts the SQL each
+# listing route sends. A route whose query count grows with the number of
+# rows it shows has fallen into N+1 lazy loading.
+
+import json
+import os
+import tempfile
+
+_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_db.close()
+os.environ['CATALOG_DATABASE_URL'] = 'sqlite:///' + _db.name
+
+from sqlalchemy import event
+
+from application import app, engine, pageCache, session
+from database_setup import Base, Category, Item, User
+from pagecache import MemoryBackend
+
+app.secret_key = 'application_test'
+
+
+class QueryCounter(object):
+    """Counts the statements sent through an engine inside a with block."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def queryCount(client, url):
+    """Returns how many statements one GET of url sends."""
+    with QueryCounter(engine) as counter:
+        response = client.get(url)
+    if response.status_code != 200:
+        raise ValueError("GET %s answered %d." % (url, response.status_code))
+    return counter.count
+
+
+def populate(categories, items):
+    """Fills the scratch database; returns the categories' ids."""
+    pageCache.backend = MemoryBackend()
+    with app.app_context():
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        ids = []
+        for c in range(categories):
+            category = Category(name='Category %d' % c)
+            session.add(category)
+            session.flush()
+            session.add_all(Item(name='Item %d.%d' % (c, i),
+                                 category_id=category.id)
+                            for i in range(items))
+            ids.append(category.id)
+        session.commit()
+        return ids
+
+
+def logIn(client):
+    """Signs client in as a new user, the way /gconnect would."""
+    with app.app_context():
+        user = User(name='Tester', email='tester@example.com')
+        session.add(user)
+        session.commit()
+        userId = user.id
+    with client.session_transaction() as visitor:
+        visitor['username'] = 'Tester'
+        visitor['email'] = 'tester@example.com'
+        visitor['user_id'] = userId
+
+
+def testListingsQueryCount():
+    populate(20, 10)
+    client = app.test_client()
+    for route in ('/', '/item/all', '/category/all', '/itemsjson'):
+        few = queryCount(client, route + '?limit=2')
+        many = queryCount(client, route + '?limit=50')
+        if few != many:
+            raise ValueError("%s sent %d queries for 2 rows but %d for 50; "
+                             "its rows are lazy loaded one at a time."
+                             % (route, few, many))
+    print "1. Listing pages send the same queries however many rows they show."
+
+
+def testDetailQueryCount():
+    [small, big] = populate(2, 0)
+    with app.app_context():
+        session.add_all(Item(name='Item %d' % i, category_id=small)
+                        for i in range(2))
+        session.add_all(Item(name='Item %d' % i, category_id=big)
+                        for i in range(50))
+        session.commit()
+        itemId = session.query(Item).first().id
+    client = app.test_client()
+    few = queryCount(client, '/category/%d' % small)
+    many = queryCount(client, '/category/%d' % big)
+    if few != many:
+        raise ValueError("A category page sent %d queries for 2 items but %d "
+                         "for 50." % (few, many))
+    if queryCount(client, '/item/%d' % itemId) != 1:
+        raise ValueError("An item page should load its category in the same "
+                         "query.")
+    print "2. Category and item pages load what they show up front."
+
+
+def testPagination():
+    populate(1, 45)
+    client = app.test_client()
+    seen = []
+    url = '/itemsjson?limit=20'
+    pages = 0
+    while url:
+        page = json.loads(client.get(url).data)
+        seen.extend(item['id'] for item in page['Items'])
+        url = page['next'] and '/itemsjson?limit=20&cursor=%d' % page['next']
+        pages += 1
+    if pages != 3 or seen != sorted(set(seen)) or len(seen) != 45:
+        raise ValueError("Following next cursors should visit every item "
+                         "once, in order.")
+    print "3. Next cursors page through every item once."
+
+
+def testStreamingExport():
+    first = populate(3, 15)[0]
+    client = app.test_client()
+    response = client.get('/catalog.json')
+    items = json.loads(response.data)['Items']
+    if [i['id'] for i in items] != range(1, 46) or 'category' not in items[0]:
+        raise ValueError("The JSON export should hold every item, in order.")
+    lines = client.get('/catalog.jsonl').data.splitlines()
+    if [json.loads(line) for line in lines] != items:
+        raise ValueError("The JSON lines export should hold the same items.")
+    etag = response.headers['ETag']
+    with QueryCounter(engine) as counter:
+        cached = client.get('/catalog.json', headers={'If-None-Match': etag})
+    if cached.status_code != 304 or counter.count != 1:
+        raise ValueError("A client holding the current tag should get a 304 "
+                         "after reading only the catalog's version.")
+    editor = app.test_client()
+    logIn(editor)
+    editor.post('/item/add/0', data={'name': 'New', 'description': 'new',
+                                     'category': str(first)})
+    changed = client.get('/catalog.json', headers={'If-None-Match': etag})
+    if changed.status_code != 200 or changed.headers['ETag'] == etag:
+        raise ValueError("Adding an item should change the export's tag.")
+    print "4. The catalog streams out as JSON and answers 304 until it changes."
+
+
+def testPageCache():
+    [first, second] = populate(2, 3)
+    firstPage = '/category/%d' % first
+    secondPage = '/category/%d' % second
+    # the same category under a padded id
+    paddedPage = '/category/0%d' % first
+    client = app.test_client()
+    pages = ['/', '/item/all', firstPage, secondPage, paddedPage, '/item/1']
+    rendered = [client.get(page).data for page in pages]
+    for (page, html) in zip(pages, rendered):
+        if queryCount(client, page) != 0 or client.get(page).data != html:
+            raise ValueError("%s should be served from the cache." % page)
+    editor = app.test_client()
+    logIn(editor)
+    editor.post('/category/edit/%d' % first,
+                data={'name': 'Renamed', 'description': ''})
+    if 'Renamed' not in client.get(firstPage).data:
+        raise ValueError("Editing a category should drop its cached page.")
+    if 'Renamed' not in client.get(paddedPage).data:
+        raise ValueError("Editing a category should drop its page however "
+                         "its id is written.")
+    if 'Renamed' not in client.get('/').data:
+        raise ValueError("Editing a category should drop pages naming it.")
+    if queryCount(client, secondPage) != 0:
+        raise ValueError("Editing a category should keep other categories' "
+                         "pages.")
+    editor.post('/item/add/0', data={'name': 'Added', 'description': 'new',
+                                     'category': str(first)})
+    if ('Added' not in client.get(firstPage).data or
+            'Added' not in client.get('/item/all').data):
+        raise ValueError("Adding an item should drop the listings showing "
+                         "it.")
+    if queryCount(client, secondPage) != 0:
+        raise ValueError("Adding an item should keep other categories' "
+                         "pages.")
+    editor.post('/item/edit/1', data={'name': 'Moved', 'description': '',
+                                      'category': str(second)})
+    moved = client.get('/item/1').data
+    if 'Moved' not in moved or 'Category 1' not in moved:
+        raise ValueError("Editing an item should drop its cached page.")
+    if ('Moved' in client.get(firstPage).data or
+            'Moved' not in client.get(secondPage).data):
+        raise ValueError("Moving an item should drop both categories' "
+                         "pages.")
+    editor.post('/item/delete/2')
+    if ('Item 0.1' in client.get(firstPage).data or
+            'Item 0.1' in client.get('/item/all').data):
+        raise ValueError("Deleting an item should drop the listings that "
+                         "showed it.")
+    lru = MemoryBackend(maxsize=2)
+    for key in ('a', 'b', 'a', 'c'):
+        lru.set(key, key)
+    if lru.get('b') is not None or lru.get('a') != 'a' or len(lru) != 2:
+        raise ValueError("The memory backend should evict the least "
+                         "recently used page.")
+    print "5. Pages are cached until a change touches what they show."
+
+
+if __name__ == '__main__':
+    try:
+        testListingsQueryCount()
+        testDetailQueryCount()
+        testPagination()
+        testStreamingExport()
+        testPageCache()
+    finally:
+        os.remove(_db.name)
+    print "Success!  All tests pass!"
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# benchmark.py -- request throughput of the catalog app against worker threads
+#
+# Needs the catalog database set up by database_setup.py. The app is driven
+# in-process through Flask's test client, one client per worker thread, so
+# every thread shares the app's engine and connection pool just as a
+# threaded server would:
+#
+#   python benchmark.py --threads 1 2 4 8 16 --seconds 10 --populate 1000
+#
+# Pool settings come from the environment; see application.py.
+#
+
+import argparse
+import sys
+import threading
+import time
+
+from application import app, session
+from database_setup import Category, Item
+
+
+ROUTES = ('/', '/item/all', '/category/all', '/itemsjson')
+
+THREADS = (1, 2, 4, 8, 16)
+
+
+def populate(items):
+    """Adds a scratch category holding items items; returns its id."""
+    category = Category(name='benchmark', description='benchmark items')
+    session.add(category)
+    session.flush()
+    session.add_all(Item(name='Item %d' % i, description='benchmark item',
+                         category_id=category.id) for i in range(items))
+    session.commit()
+    return category.id
+
+
+def depopulate(category_id):
+    """Throws away a scratch category made by populate()."""
+    session.query(Item).filter_by(category_id=category_id).delete()
+    session.query(Category).filter_by(id=category_id).delete()
+    session.commit()
+
+
+def _worker(routes, deadline, counts, errors):
+    client = app.test_client()
+    done = 0
+    failed = 0
+    while time.time() < deadline:
+        for route in routes:
+            if client.get(route).status_code != 200:
+                failed += 1
+            done += 1
+    counts.append(done)
+    errors.append(failed)
+
+
+def benchThreads(threads=THREADS, seconds=5, routes=ROUTES):
+    """Measures requests per second for each number of worker threads.
+
+    Each thread requests routes in turn, as fast as it can, for seconds.
+
+    Returns:
+      A list of (threads, requests, errors, requests per second) tuples.
+    """
+    results = []
+    for workers in threads:
+        counts = []
+        errors = []
+        deadline = time.time() + seconds
+        start = time.time()
+        pool = [threading.Thread(target=_worker,
+                                 args=(routes, deadline, counts, errors))
+                for i in range(workers)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.time() - start
+        results.append((workers, sum(counts), sum(errors),
+                        sum(counts) / elapsed))
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Time catalog requests against the number of threads.')
+    parser.add_argument('--threads', nargs='*', type=int, default=THREADS)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--routes', nargs='*', default=ROUTES)
+    parser.add_argument('--populate', type=int, default=0,
+                        help='add this many scratch items for the run')
+    args = parser.parse_args(argv[1:])
+
+    app.secret_key = 'benchmark'
+    with app.app_context():
+        category_id = populate(args.populate) if args.populate else None
+    try:
+        print "%8s %10s %8s %14s" % ("threads", "requests", "errors",
+                                     "requests/sec")
+        for (threads, requests, errors, rate) in benchThreads(
+                args.threads, args.seconds, args.routes):
+            print "%8d %10d %8d %14.1f" % (threads, requests, errors, rate)
+    finally:
+        if category_id is not None:
+            with app.app_context():
+                depopulate(category_id)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
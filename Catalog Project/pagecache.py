@@ -0,0 +1,124 @@
+# PAGE CACHE
+# Rendered pages kept between requests, keyed on the page's URL, the
+# visitor's login state and the generations of the namespaces the page was
+# built from ('items', 'categories', 'category:<id>', 'item:<id>').
+# Invalidating a namespace bumps its generation, so every page built from it
+# stops matching at once; the old copies are never read again and age out
+# of the backend on their own.
+import threading
+from collections import OrderedDict
+
+
+class CacheBackend(object):
+    """Where pages and generations are stored; subclass to add a new store.
+
+    The three calls map onto plain Redis commands, so a shared store can sit
+    behind the same interface as the in-process one.
+    """
+
+    def get(self, key):
+        """Returns the value stored at key, or None."""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """Stores a value at key, possibly pushing out older entries."""
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Adds one to the counter at key (from 0) and returns it."""
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """An in-process LRU of pages, safe to share between threads.
+
+    Generations are kept apart from the pages and never evicted, since
+    losing one would let stale pages match again.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._pages = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            value = self._pages.pop(key, None)
+            if value is not None:
+                self._pages[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._pages.pop(key, None)
+            self._pages[key] = value
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def __len__(self):
+        return len(self._pages)
+
+
+class RedisBackend(CacheBackend):
+    """Pages and generations in Redis, shared by every app process.
+
+    Takes any client with Redis's get/set/incr, e.g. redis.StrictRedis(),
+    or a local stand-in offering the same three calls. Pages expire after
+    ttl seconds; generations never do.
+    """
+
+    def __init__(self, client, ttl=3600, prefix='catalog:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is not None and key.startswith('gen:'):
+            return int(value)
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class PageCache(object):
+    """Rendered pages, invalidated by namespace."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, url, loggedIn, namespaces):
+        generations = ','.join('%s=%d' % (ns, self.backend.get('gen:' + ns)
+                                          or 0)
+                               for ns in namespaces)
+        return 'page:%s|%s|%s' % (url, loggedIn, generations)
+
+    def get(self, key):
+        page = self.backend.get(key)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def set(self, key, page):
+        self.backend.set(key, page)
+
+    def invalidate(self, *namespaces):
+        """Drops every page built from any of the namespaces."""
+        for ns in namespaces:
+            self.backend.incr('gen:' + ns)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+#
+# backends.py -- interchangeable storage for the tournament engine
+#
+# tournament.Tournament keeps everything in PostgreSQL. SQLiteTournament and
+# MemoryTournament offer the same calls on top of an SQLite file and plain
+# Python objects, for local simulations and tests that have no database
+# server. openTournament() picks one by name.
+#
+
+import sqlite3
+
+import queries
+from pairing import pairPlayers
+from queries import BYE, DEFAULT_TOURNAMENT, TIEBREAKS
+from ratings import INITIAL_RATING, rate, replay
+from standings import Standings
+
+
+class Backend(object):
+    """The calls every storage backend offers.
+
+    Subclasses store the data; the pairing is done here, the same way for
+    all of them, from the Standings model each one loads.
+    """
+
+    def close(self):
+        """Releases whatever the backend holds open."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reportMatch(self, winner, loser, round=None,
+                    tournament=DEFAULT_TOURNAMENT, result=None):
+        """Records the outcome of a single match; see Tournament."""
+        row = (winner, loser) if result is None else (winner, loser, result)
+        self.reportMatches([row], round, tournament)
+
+    def iterStandings(self, tournament=DEFAULT_TOURNAMENT, tiebreaks=(),
+                      batch_size=1000):
+        """Yields the rows of playerStandings() one at a time.
+
+        These backends rank the field in Python, so the rows are all built
+        first; batch_size is accepted for the PostgreSQL backend's sake.
+        """
+        for row in self.playerStandings(tournament, tiebreaks):
+            yield row
+
+    def loadEvents(self, tournaments):
+        """Returns (tournament, model, names, ratings) for each tournament."""
+        return [(t, self.loadStandings(t), self.playerNames(t), self.ratings(t))
+                for t in tournaments]
+
+    def playerRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a list of (id, name, rating) tuples, highest rated first."""
+        names = self.playerNames(tournament)
+        rated = self.ratings(tournament)
+        return sorted(((pid, names[pid], rated[pid]) for pid in names),
+                      key=lambda row: (-row[2], row[0]))
+
+    def swissPairings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns (id1, name1, id2, name2) pairs for the next round.
+
+        Before anyone has played, players are seeded by rating.
+        """
+        model = self.loadStandings(tournament)
+        names = self.playerNames(tournament)
+        seeds = None
+        if not any(model.matches):
+            seeds = self.ratings(tournament)
+        ids, scores = model.rankedColumns(seeds)
+        pairs, bye = pairPlayers(ids, scores, model.opponents, model.byes)
+        return queries.teams(pairs, bye, names)
+
+
+def _rankRows(model, names, tiebreaks, matches):
+    """Builds playerStandings() rows from a model, best first."""
+    for name in tiebreaks:
+        if name not in TIEBREAKS:
+            raise ValueError("unknown tiebreak %r; choose from %s"
+                             % (name, ", ".join(sorted(TIEBREAKS))))
+    scores = model.tiebreaks(matches()) if tiebreaks else {}
+    rows = []
+    points = []
+    for i, pid in enumerate(model.ids):
+        rows.append((pid, names[pid], model.wins[i], model.matches[i]) +
+                    tuple(scores[name][pid] for name in tiebreaks))
+        points.append(2 * model.wins[i] + model.draws[i])
+    # by score, as Standings.ranked() orders players for pairing
+    order = sorted(range(len(rows)),
+                   key=lambda i: (-points[i],) +
+                   tuple(-v for v in rows[i][4:]) + (rows[i][0],))
+    return [rows[i] for i in order]
+
+
+class MemoryTournament(Backend):
+    """Tournament storage held entirely in memory.
+
+    Standings are kept in a Standings model per tournament that every result
+    updates in place, so a whole simulated event never leaves Python.
+    """
+
+    def __init__(self):
+        self._nextPlayer = 1
+        self._nextTournament = DEFAULT_TOURNAMENT
+        self._names = {}
+        self._ratings = {}
+        self._initial = {}
+        self._models = {}
+        self._matches = {}
+        self.archived = set()
+        self.createTournament('default')
+
+    def _model(self, tournament):
+        try:
+            return self._models[tournament]
+        except KeyError:
+            raise ValueError("no tournament %s" % tournament)
+
+    def createTournament(self, name):
+        """Starts a new tournament and returns its id."""
+        tournament = self._nextTournament
+        self._nextTournament += 1
+        self._names[tournament] = {}
+        self._ratings[tournament] = {}
+        self._initial[tournament] = {}
+        self._models[tournament] = Standings(tournament)
+        self._matches[tournament] = []
+        return tournament
+
+    def archiveTournament(self, tournament):
+        """Marks a tournament finished; its data stays readable."""
+        self._model(tournament)
+        self.archived.add(tournament)
+
+    def deleteMatches(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the match records and the ratings earned from them."""
+        old = self._model(tournament)
+        model = Standings(tournament)
+        for pid in old.ids:
+            model.addPlayer(pid)
+        self._models[tournament] = model
+        self._matches[tournament] = []
+        self._ratings[tournament] = dict(self._initial[tournament])
+
+    def deletePlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the player records from one tournament."""
+        self._model(tournament)
+        if self._matches[tournament]:
+            raise ValueError("players in tournament %s still have matches"
+                             % tournament)
+        self._names[tournament] = {}
+        self._ratings[tournament] = {}
+        self._initial[tournament] = {}
+        self._models[tournament] = Standings(tournament)
+
+    def countPlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns the number of players currently registered."""
+        return len(self._model(tournament))
+
+    def registerPlayer(self, pname, tournament=DEFAULT_TOURNAMENT,
+                       rating=None):
+        """Adds a player to a tournament and returns the new id."""
+        return self.registerPlayers([(pname, rating)], tournament)[0]
+
+    def registerPlayers(self, players, tournament=DEFAULT_TOURNAMENT,
+                        header=False):
+        """Adds many players; returns their ids in input order.
+
+        players are names, (name, rating) rows or an open CSV file of them;
+        header skips the first row.
+        """
+        model = self._model(tournament)
+        names = self._names[tournament]
+        rated = self._ratings[tournament]
+        initial = self._initial[tournament]
+        ids = []
+        for (name, rating) in queries.playerRows(players, header):
+            pid = self._nextPlayer
+            self._nextPlayer += 1
+            names[pid] = name
+            rated[pid] = initial[pid] = (INITIAL_RATING if rating is None
+                                         else rating)
+            model.addPlayer(pid)
+            ids.append(pid)
+        return ids
+
+    def playerNames(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a dict of player id to name."""
+        self._model(tournament)
+        return self._names[tournament]
+
+    def ratings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a dict of player id to rating."""
+        self._model(tournament)
+        return self._ratings[tournament]
+
+    def recalculateRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Rebuilds a tournament's ratings from its match history."""
+        self._model(tournament)
+        self._ratings[tournament] = replay(self._matches[tournament],
+                                           self._initial[tournament])
+        return len(self._ratings[tournament])
+
+    def playerStandings(self, tournament=DEFAULT_TOURNAMENT, tiebreaks=()):
+        """Returns (id, name, wins, matches, ...) rows, best first."""
+        return _rankRows(self._model(tournament), self._names[tournament],
+                         tiebreaks, lambda: self._matches[tournament])
+
+    def reportMatches(self, results, round=None,
+                      tournament=DEFAULT_TOURNAMENT):
+        """Records a whole round; the batch is rejected as a whole."""
+        rows = queries.matchRows(results)
+        model = self._model(tournament)
+        missing = sum(1 for (winner, loser, result) in rows
+                      if winner not in model.index or
+                      (loser is not None and loser not in model.index))
+        if missing:
+            raise queries.rejectedMatches(len(rows) - missing, rows, tournament)
+        for (winner, loser, result) in rows:
+            model.recordMatch(winner, loser, result)
+        self._matches[tournament].extend(rows)
+        rate(rows, self._ratings[tournament])
+        return len(rows)
+
+    def loadStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns the live Standings model; callers must not change it."""
+        return self._model(tournament)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tournaments (id INTEGER PRIMARY KEY,
+                                        name TEXT,
+                                        archived INTEGER NOT NULL DEFAULT 0);
+
+CREATE TABLE IF NOT EXISTS players (id INTEGER PRIMARY KEY,
+                                    tournament INTEGER NOT NULL DEFAULT 1 REFERENCES tournaments (id),
+                                    name TEXT,
+                                    rating REAL NOT NULL DEFAULT 1500,
+                                    initial_rating REAL NOT NULL DEFAULT 1500);
+CREATE INDEX IF NOT EXISTS players_tournament ON players (tournament);
+
+CREATE TABLE IF NOT EXISTS matches (id INTEGER PRIMARY KEY,
+                                    tournament INTEGER NOT NULL DEFAULT 1,
+                                    round INTEGER,
+                                    winner INTEGER REFERENCES players (id),
+                                    loser INTEGER REFERENCES players (id),
+                                    result TEXT NOT NULL DEFAULT 'win'
+                                        CHECK (result IN ('win', 'draw', 'bye')),
+                                    CHECK ((result = 'bye') = (loser IS NULL)));
+CREATE INDEX IF NOT EXISTS matches_winner ON matches (tournament, winner, loser);
+CREATE INDEX IF NOT EXISTS matches_loser ON matches (tournament, loser, winner);
+
+CREATE TABLE IF NOT EXISTS standings (player INTEGER PRIMARY KEY REFERENCES players (id),
+                                      tournament INTEGER NOT NULL,
+                                      wins INTEGER NOT NULL DEFAULT 0,
+                                      losses INTEGER NOT NULL DEFAULT 0,
+                                      draws INTEGER NOT NULL DEFAULT 0,
+                                      byes INTEGER NOT NULL DEFAULT 0,
+                                      matches INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS standings_rank ON standings (tournament, (2 * wins + draws) DESC, player);
+
+CREATE TRIGGER IF NOT EXISTS players_standing AFTER INSERT ON players BEGIN
+    INSERT INTO standings (player, tournament) VALUES (NEW.id, NEW.tournament);
+END;
+
+CREATE TRIGGER IF NOT EXISTS players_unstanding AFTER DELETE ON players BEGIN
+    DELETE FROM standings WHERE player = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS matches_insert AFTER INSERT ON matches BEGIN
+    UPDATE standings SET wins = wins + (NEW.result <> 'draw'),
+                         draws = draws + (NEW.result = 'draw'),
+                         byes = byes + (NEW.result = 'bye'),
+                         matches = matches + 1
+     WHERE player = NEW.winner;
+    UPDATE standings SET losses = losses + (NEW.result <> 'draw'),
+                         draws = draws + (NEW.result = 'draw'),
+                         matches = matches + 1
+     WHERE player = NEW.loser;
+END;
+
+CREATE TRIGGER IF NOT EXISTS matches_delete AFTER DELETE ON matches BEGIN
+    UPDATE standings SET wins = wins - (OLD.result <> 'draw'),
+                         draws = draws - (OLD.result = 'draw'),
+                         byes = byes - (OLD.result = 'bye'),
+                         matches = matches - 1
+     WHERE player = OLD.winner;
+    UPDATE standings SET losses = losses - (OLD.result <> 'draw'),
+                         draws = draws - (OLD.result = 'draw'),
+                         matches = matches - 1
+     WHERE player = OLD.loser;
+END;
+
+INSERT OR IGNORE INTO tournaments (id, name) VALUES (1, 'default');
+"""
+
+
+class SQLiteTournament(Backend):
+    """Tournament storage in an SQLite database file.
+
+    The schema mirrors tournament.sql, standings triggers included, minus
+    partitioning: archiving a tournament only marks it finished.
+
+    Args:
+      path: the database file, or ':memory:' for a throwaway database.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def createTournament(self, name):
+        """Starts a new tournament and returns its id."""
+        with self.conn:
+            return self.conn.execute("INSERT INTO tournaments (name) VALUES (?)",
+                                     (name,)).lastrowid
+
+    def archiveTournament(self, tournament):
+        """Marks a tournament finished; its data stays where it is."""
+        with self.conn:
+            self.conn.execute("UPDATE tournaments SET archived = 1 WHERE id = ?",
+                              (tournament,))
+
+    def deleteMatches(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the match records and the ratings earned from them."""
+        with self.conn:
+            self.conn.execute("DELETE FROM matches WHERE tournament = ?",
+                              (tournament,))
+            self.conn.execute("UPDATE players SET rating = initial_rating "
+                              "WHERE tournament = ?", (tournament,))
+
+    def deletePlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the player records from one tournament."""
+        with self.conn:
+            self.conn.execute("DELETE FROM players WHERE tournament = ?",
+                              (tournament,))
+
+    def countPlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns the number of players currently registered."""
+        return self.conn.execute("SELECT COUNT(name) FROM players "
+                                 "WHERE tournament = ?",
+                                 (tournament,)).fetchone()[0]
+
+    def registerPlayer(self, pname, tournament=DEFAULT_TOURNAMENT,
+                       rating=None):
+        """Adds a player to a tournament and returns the new id."""
+        if rating is None:
+            rating = INITIAL_RATING
+        with self.conn:
+            return self.conn.execute("INSERT INTO players (tournament, name, "
+                                     "rating, initial_rating) "
+                                     "VALUES (?, ?, ?, ?)",
+                                     (tournament, pname, rating,
+                                      rating)).lastrowid
+
+    def registerPlayers(self, players, tournament=DEFAULT_TOURNAMENT,
+                        header=False):
+        """Adds many players in one transaction; returns ids in input order.
+
+        players are names, (name, rating) rows or an open CSV file of them;
+        header skips the first row. SQLite lets one writer in at a time, so
+        ids counted on from the largest one in use cannot be taken by anyone
+        else meanwhile.
+        """
+        rows = list(queries.playerRows(players, header))
+        with self.conn:
+            start = self.conn.execute("SELECT coalesce(max(id), 0) + 1 "
+                                      "FROM players").fetchone()[0]
+            ids = list(range(start, start + len(rows)))
+            params = []
+            for pid, (name, rating) in zip(ids, rows):
+                if rating is None:
+                    rating = INITIAL_RATING
+                params.append((pid, tournament, name, rating, rating))
+            self.conn.executemany("INSERT INTO players (id, tournament, name, "
+                                  "rating, initial_rating) "
+                                  "VALUES (?, ?, ?, ?, ?)", params)
+        return ids
+
+    def playerNames(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a dict of player id to name."""
+        return dict(self.conn.execute("SELECT id, name FROM players "
+                                      "WHERE tournament = ?", (tournament,)))
+
+    def ratings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a dict of player id to rating."""
+        return dict(self.conn.execute("SELECT id, rating FROM players "
+                                      "WHERE tournament = ?", (tournament,)))
+
+    def recalculateRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Rebuilds a tournament's ratings from its match history."""
+        with self.conn:
+            rebuilt = replay(self._matches(tournament),
+                             dict(self.conn.execute(
+                                 "SELECT id, initial_rating FROM players "
+                                 "WHERE tournament = ?", (tournament,))))
+            self._saveRatings(rebuilt)
+        return len(rebuilt)
+
+    def _saveRatings(self, rated):
+        self.conn.executemany("UPDATE players SET rating = ? WHERE id = ?",
+                              [(rating, pid) for pid, rating in rated.items()])
+
+    def _matches(self, tournament):
+        return self.conn.execute("SELECT winner, loser, result FROM matches "
+                                 "WHERE tournament = ? ORDER BY id",
+                                 (tournament,))
+
+    def playerStandings(self, tournament=DEFAULT_TOURNAMENT, tiebreaks=()):
+        """Returns (id, name, wins, matches, ...) rows, best first."""
+        return _rankRows(self.loadStandings(tournament),
+                         self.playerNames(tournament), tiebreaks,
+                         lambda: self._matches(tournament))
+
+    def reportMatches(self, results, round=None,
+                      tournament=DEFAULT_TOURNAMENT):
+        """Records a whole round in one transaction; see Tournament."""
+        rows = queries.matchRows(results)
+        if not rows:
+            return 0
+        players = [p for row in rows for p in row[:2] if p is not None]
+        with self.conn:
+            rated = {}
+            # older SQLite builds take at most 999 parameters per statement
+            for start in range(0, len(players), 900):
+                chunk = players[start:start + 900]
+                rated.update(self.conn.execute(
+                    "SELECT id, rating FROM players WHERE tournament = ? "
+                    "AND id IN (%s)" % ", ".join("?" * len(chunk)),
+                    [tournament] + chunk))
+            found = len(rated)
+            if found != len(players):
+                raise ValueError("reportMatches: %d players are not "
+                                 "registered in tournament %s"
+                                 % (len(players) - found, tournament))
+            self.conn.executemany("INSERT INTO matches (tournament, round, "
+                                  "winner, loser, result) "
+                                  "VALUES (?, ?, ?, ?, ?)",
+                                  [(tournament, round) + row for row in rows])
+            self._saveRatings(rate(rows, rated))
+        return len(rows)
+
+    def loadStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a Standings model of one tournament."""
+        opponents = {}
+        for (winner, loser, result) in self._matches(tournament):
+            if result != BYE:
+                opponents.setdefault(winner, []).append(loser)
+                opponents.setdefault(loser, []).append(winner)
+        rows = self.conn.execute("SELECT player, wins, draws, matches, byes "
+                                 "FROM standings WHERE tournament = ? "
+                                 "ORDER BY 2 * wins + draws DESC, player",
+                                 (tournament,))
+        return Standings.fromRows((row + (opponents.get(row[0], ()),)
+                                   for row in rows), tournament)
+
+
+def _postgres(**options):
+    from tournament import Tournament
+    return Tournament(**options)
+
+
+BACKENDS = {
+    'postgresql': _postgres,
+    'sqlite': SQLiteTournament,
+    'memory': MemoryTournament,
+}
+
+
+def openTournament(backend='postgresql', **options):
+    """Opens tournament storage of the named kind.
+
+    Args:
+      backend: 'postgresql' (tournament.Tournament), 'sqlite' or 'memory'.
+      options: passed on to the backend's constructor, e.g. dsn or maxconn
+        for PostgreSQL and path for SQLite.
+
+    Returns:
+      An object with the same calls as tournament.Tournament.
+    """
+    try:
+        factory = BACKENDS[backend]
+    except KeyError:
+        raise ValueError("unknown backend %r; choose from %s"
+                         % (backend, ", ".join(sorted(BACKENDS))))
+    return factory(**options)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#
+# Test cases for backends.py. The SQLite and in-memory backends run without
+# a database server.
+
+import os
+import random
+import time
+from StringIO import StringIO
+
+from backends import openTournament
+from export import exportStandings
+from queries import BYE, DRAW
+from scheduler import pairTournaments
+from standings import Standings
+
+
+def _backends():
+    return [openTournament('memory'), openTournament('sqlite')]
+
+
+def testRegisterAndCount():
+    for t in _backends():
+        with t:
+            if t.countPlayers() != 0:
+                raise ValueError("A new backend should have no players.")
+            t.registerPlayer("Chandra Nalaar")
+            ids = t.registerPlayers(["Markov Chaney", "Joe Malik"])
+            if t.countPlayers() != 3 or len(set(ids)) != 2:
+                raise ValueError("Every backend should count registrations.")
+            t.deletePlayers()
+            if t.countPlayers() != 0:
+                raise ValueError("After deleting, countPlayers should be 0.")
+            ids = t.registerPlayers(StringIO("name,rating\nAce,1600\nBea,\n"),
+                                    header=True)
+            if t.playerNames() != dict(zip(ids, ["Ace", "Bea"])):
+                raise ValueError("Every backend should read names from a CSV "
+                                 "file, skipping its header.")
+            if t.ratings() != dict(zip(ids, [1600, 1500])):
+                raise ValueError("Every backend should read ratings from a "
+                                 "CSV file.")
+            t.deletePlayers()
+    print "1. Players can be registered, counted and deleted on every backend."
+
+
+def testReportAndPair():
+    for t in _backends():
+        with t:
+            [a, b, c, d] = t.registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+            t.reportMatches([(a, b), (c, d)], round=1)
+            pairings = t.swissPairings()
+            if set((row[0], row[2]) for row in pairings) != set([(a, c),
+                                                                (b, d)]):
+                raise ValueError("Winners should be paired with winners.")
+            t.reportMatches([(a, c), (b, d, True)], round=2)
+            standings = t.playerStandings(
+                tiebreaks=['buchholz', 'sonneborn_berger'])
+            if [row[0] for row in standings] != [a, c, b, d]:
+                raise ValueError("Ties in wins should be broken by Buchholz "
+                                 "score.")
+            expected = {a: (1.5, 1.5), b: (2.5, 0.25), c: (2.5, 0.5),
+                        d: (1.5, 0.25)}
+            for row in standings:
+                if (row[4], row[5]) != expected[row[0]]:
+                    raise ValueError("Tiebreaks should match the PostgreSQL "
+                                     "backend's.")
+    print "2. Every backend reports, pairs and breaks ties the same way."
+
+
+def testSeparateTournaments():
+    for t in _backends():
+        with t:
+            other = t.createTournament("Spring Open")
+            [a, b] = t.registerPlayers(["Ace", "Bea"])
+            [c] = t.registerPlayers(["Cid"], other)
+            try:
+                t.reportMatch(a, c)
+            except ValueError:
+                pass
+            else:
+                raise ValueError("A result naming a player from another "
+                                 "tournament should be rejected.")
+            t.reportMatch(a, b)
+            if t.countPlayers(other) != 1 or t.playerStandings(other)[0][2]:
+                raise ValueError("Tournaments should not see each other's "
+                                 "players or matches.")
+            t.deleteMatches()
+            if any(row[3] for row in t.playerStandings()):
+                raise ValueError("After deleting matches nobody has played.")
+    print "3. Each backend keeps tournaments apart."
+
+
+def testRatings():
+    for t in _backends():
+        with t:
+            [a, b, c] = t.registerPlayers([("Ace", 1600), ("Bea", 1400),
+                                           "Cid"])
+            d = t.registerPlayer("Dot", rating=1450)
+            seeded = dict((row[0], row[2]) for row in t.playerRatings())
+            pairings = [(row[0], row[2]) for row in t.swissPairings()]
+            if pairings != [(a, c), (d, b)]:
+                raise ValueError("The first round should be seeded by the "
+                                 "ratings players register with.")
+            t.reportMatches([(b, a), (c, d)], round=1)
+            rated = dict((row[0], row[2]) for row in t.playerRatings())
+            if rated[b] - 1400 <= rated[c] - 1500:
+                raise ValueError("An upset should move the players further "
+                                 "than a favourite's win.")
+            t.recalculateRatings()
+            if dict((row[0], row[2]) for row in t.playerRatings()) != rated:
+                raise ValueError("Replaying the history should give the same "
+                                 "ratings.")
+            t.deleteMatches()
+            if dict((row[0], row[2]) for row in t.playerRatings()) != seeded:
+                raise ValueError("Deleting the matches should restore the "
+                                 "ratings players registered with.")
+    print "4. Every backend rates results and seeds the first round by rating."
+
+
+def testExport():
+    for t in _backends():
+        with t:
+            [a, b, c] = t.registerPlayers(["Ace", "Bea", "Cid"])
+            t.reportMatches([(b, a)], round=1)
+            out = StringIO()
+            exportStandings(t, out, format='csv', tiebreaks=['buchholz'])
+            if out.getvalue().splitlines() != ["id,name,wins,matches,buchholz",
+                                               "%d,Bea,1,1,0.0" % b,
+                                               "%d,Ace,0,1,1.0" % a,
+                                               "%d,Cid,0,0,0.0" % c]:
+                raise ValueError("Standings should export as CSV, best first.")
+            out = StringIO()
+            if exportStandings(t, out, format='jsonl') != 3:
+                raise ValueError("Every player should be exported.")
+    print "5. Every backend's standings export as CSV and JSON lines."
+
+
+class _Crashing(object):
+    """A standings model whose worker process dies while pairing it."""
+    matches = [1]
+
+    def rankedColumns(self, seeds):
+        os._exit(1)
+
+
+class _CrashingEvents(object):
+    def loadEvents(self, tournaments):
+        return [(t, _Crashing(), {}, {}) for t in tournaments]
+
+
+def testScheduler():
+    rng = random.Random(0)
+    with openTournament('memory') as t:
+        events = [t.createTournament("Event %d" % i) for i in range(12)]
+        for i, tournament in enumerate(events):
+            names = ["Player %d" % n for n in range(5 + 40 * i)]
+            ids = t.registerPlayers(names, tournament)
+            rng.shuffle(ids)
+            t.reportMatches(zip(ids[::2], ids[1::2]), 1, tournament)
+        results = list(pairTournaments(t, events, processes=3, batch_size=5))
+        if sorted(r[0] for r in results) != events:
+            raise ValueError("Every tournament should be paired exactly once.")
+        for (tournament, pairings, timings) in results:
+            if pairings != t.swissPairings(tournament):
+                raise ValueError("The scheduler should pair each event just "
+                                 "as swissPairings() does.")
+            if sorted(timings) != ['elapsed', 'load', 'pair']:
+                raise ValueError("Each event should come with its timings.")
+    try:
+        list(pairTournaments(_CrashingEvents(), [7, 8], processes=2))
+    except RuntimeError as e:
+        if '7, 8' not in str(e):
+            raise ValueError("A lost event should be named in the error.")
+    else:
+        raise ValueError("A dead worker should not leave the scheduler "
+                         "waiting forever.")
+    print "6. Many tournaments are paired at once in a process pool."
+
+
+def testByesAndDraws():
+    for t in _backends():
+        with t:
+            ids = t.registerPlayers(["Ace", "Bea", "Cid", "Dot", "Eve"])
+            pairings = t.swissPairings()
+            [bye] = [row[0] for row in pairings if row[2] is None]
+            results = [(row[0], row[2], DRAW) for row in pairings
+                       if row[2] is not None]
+            results.append((bye, None))
+            t.reportMatches(results, round=1)
+            standings = dict((row[0], row[2:4]) for row in t.playerStandings())
+            if standings[bye] != (1, 1):
+                raise ValueError("A bye should count as a win.")
+            if any(standings[pid] != (0, 1) for pid in ids if pid != bye):
+                raise ValueError("A draw should count as played, not won.")
+            if bye in [row[0] for row in t.swissPairings() if row[2] is None]:
+                raise ValueError("Nobody should be given a second bye.")
+            try:
+                t.reportMatch(ids[0], ids[1], result=BYE)
+            except ValueError:
+                pass
+            else:
+                raise ValueError("A bye should not name an opponent.")
+    for t in _backends():
+        with t:
+            [a, b, c, d] = t.registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+            t.reportMatches([(a, b), (c, d, DRAW)], round=1)
+            for tiebreaks in ((), ('buchholz',)):
+                ranked = [row[0] for row in t.playerStandings(
+                    tiebreaks=tiebreaks)]
+                if ranked != [a, c, d, b]:
+                    raise ValueError("A draw should rank above a loss.")
+    print "7. Every backend records byes and draws as they are reported."
+
+
+def testRematchedStandings():
+    with openTournament('memory') as t:
+        [a, b, c, d] = t.registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+        t.reportMatches([(a, b), (c, d)], round=1)
+        t.reportMatches([(b, a, DRAW), (d, c)], round=2)
+        model = t.loadStandings()
+        fresh = Standings.fromRows(
+            (pid, model.wins[i], model.draws[i], model.matches[i],
+             pid in model.byes, model.opponents[pid])
+            for i, pid in enumerate(model.ids))
+        if list(model.oppScores) != list(fresh.oppScores):
+            raise ValueError("A rematch should count its opponent once, as a "
+                             "freshly loaded model does.")
+    print "8. Standings updated through a rematch match a fresh load."
+
+
+def testMemorySimulation():
+    rng = random.Random(0)
+    start = time.time()
+    with openTournament('memory') as t:
+        t.registerPlayers("Player %d" % i for i in range(100000))
+        for rnd in range(1, 18):
+            results = []
+            for (id1, name1, id2, name2) in t.swissPairings():
+                if id2 is None:
+                    results.append((id1, None))
+                else:
+                    results.append((id1, id2) if rng.random() < 0.5
+                                   else (id2, id1))
+            t.reportMatches(results, rnd)
+        if t.playerStandings()[0][3] != 17:
+            raise ValueError("Every paired player should have played 17 "
+                             "matches.")
+    print ("9. A 100k-player, 17-round event plays out in memory in %.1fs."
+           % (time.time() - start))
+
+
+if __name__ == '__main__':
+    testRegisterAndCount()
+    testReportAndPair()
+    testSeparateTournaments()
+    testRatings()
+    testExport()
+    testScheduler()
+    testByesAndDraws()
+    testRematchedStandings()
+    testMemorySimulation()
+    print "Success!  All tests pass!"
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#
+# benchmark.py -- timing runs for the tournament backend
+#
+# Needs a database set up from tournament.sql. Every run plays out in a
+# scratch tournament of its own, which is archived and dropped afterwards.
+#
+# With no arguments, full Swiss events of 64, 1k, 10k and 100k players are
+# simulated and a JSON report of per-operation latencies and query counts is
+# printed (or written with --output). --tiebreaks times the tiebreak query
+# instead, and --prepared compares the hot calls with and without prepared
+# statements.
+#
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+from instrument import Aggregator, addHook, disable, enable, removeHook
+from tournament import Tournament, TIEBREAKS
+
+
+SIZES = (64, 1000, 10000, 100000)
+
+# registrations are sent in batches of this many players
+REGISTER_CHUNK = 1000
+
+# boards per round reported one at a time with reportMatch(); the rest of
+# the round goes through reportMatches() so big events finish in minutes
+SINGLE_REPORTS = 100
+
+
+def swissRounds(players):
+    """The number of rounds needed to find a single undefeated player."""
+    return max(1, int(math.ceil(math.log(players, 2))))
+
+
+def playEvent(t, tournament, players, rounds, rng):
+    """Registers players and plays Swiss rounds with random results."""
+    names = ["Player %d" % i for i in range(players)]
+    for start in range(0, players, REGISTER_CHUNK):
+        t.registerPlayers(names[start:start + REGISTER_CHUNK], tournament)
+    for rnd in range(1, rounds + 1):
+        results = []
+        for (id1, name1, id2, name2) in t.swissPairings(tournament):
+            if id2 is None:
+                results.append((id1, None))
+            else:
+                results.append((id1, id2) if rng.random() < 0.5 else (id2, id1))
+        for (winner, loser) in results[:SINGLE_REPORTS]:
+            t.reportMatch(winner, loser, rnd, tournament)
+        if results[SINGLE_REPORTS:]:
+            t.reportMatches(results[SINGLE_REPORTS:], rnd, tournament)
+        t.playerStandings(tournament)
+    t.countPlayers(tournament)
+
+
+def dropTournament(t, tournament):
+    """Archives a scratch tournament and throws its data away."""
+    t.archiveTournament(tournament)
+    with t.cursor() as c:
+        c.execute("DROP TABLE matches_%d" % tournament)
+        c.execute("DELETE FROM players WHERE tournament = %s", (tournament,))
+
+
+def benchEvents(t, sizes=SIZES, rounds=None, seed=0):
+    """Simulates a full event at each size and reports on every operation.
+
+    Args:
+      t: a Tournament; its calls and statements are timed through
+        instrument.py, so its cursors must be InstrumentedCursors.
+      sizes: the field sizes to simulate.
+      rounds: the number of rounds to play; by default enough for a single
+        undefeated player.
+      seed: seeds the random match results.
+
+    Returns:
+      A list with one dict per size, ready to be dumped as JSON.
+    """
+    rng = random.Random(seed)
+    runs = []
+    for players in sizes:
+        eventRounds = rounds or swissRounds(players)
+        tournament = t.createTournament("benchmark %d" % players)
+        stats = Aggregator()
+        addHook(stats)
+        enable()
+        start = time.time()
+        try:
+            playEvent(t, tournament, players, eventRounds, rng)
+        finally:
+            disable()
+            removeHook(stats)
+            dropTournament(t, tournament)
+        runs.append({
+            'players': players,
+            'rounds': eventRounds,
+            'wall_s': time.time() - start,
+            'operations': stats.report(),
+        })
+    return runs
+
+
+def benchTiebreaks(t, sizes=(64, 1000, 10000), rounds=7, repeat=5, seed=0):
+    """Times the batched tiebreak query against the number of matches.
+
+    Returns a list of (players, matches, seconds) tuples, taking the best of
+    repeat runs. Linear scaling shows up as a flat time per match.
+    """
+    rng = random.Random(seed)
+    results = []
+    for players in sizes:
+        tournament = t.createTournament("tiebreak benchmark %d" % players)
+        try:
+            playEvent(t, tournament, players, rounds, rng)
+            best = None
+            for i in range(repeat):
+                start = time.time()
+                t.playerStandings(tournament, sorted(TIEBREAKS))
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append((players, players // 2 * rounds, best))
+        finally:
+            dropTournament(t, tournament)
+    return results
+
+
+def benchPrepared(options, players=1000, repeat=3):
+    """Compares the hot calls' throughput with and without prepared statements.
+
+    Each mode gets a pooled handle of its own with the cache turned off, so
+    every call reaches the database. Players are registered, and a round
+    reported, one call at a time.
+
+    Returns:
+      A list of (operation, adhoc, prepared) tuples, in calls per second,
+      each the best of repeat runs.
+    """
+    best = {}
+    for prepare in (False, True):
+        with Tournament(cacheSize=0, prepare=prepare, **options) as t:
+            for i in range(repeat):
+                tournament = t.createTournament("prepared benchmark")
+                try:
+                    rates = _hotCalls(t, tournament, players)
+                finally:
+                    dropTournament(t, tournament)
+                for (operation, rate) in rates:
+                    key = (operation, prepare)
+                    best[key] = max(best.get(key, 0), rate)
+    operations = ('registerPlayer', 'reportMatch', 'playerStandings',
+                  'countPlayers')
+    return [(op, best[(op, False)], best[(op, True)]) for op in operations]
+
+
+def _hotCalls(t, tournament, players):
+    """Times players calls of each hot operation; returns calls per second."""
+    rates = []
+    start = time.time()
+    ids = [t.registerPlayer("Player %d" % i, tournament)
+           for i in range(players)]
+    rates.append(('registerPlayer', players / (time.time() - start)))
+    start = time.time()
+    for (winner, loser) in zip(ids[0::2], ids[1::2]):
+        t.reportMatch(winner, loser, 1, tournament)
+    rates.append(('reportMatch', players // 2 / (time.time() - start)))
+    # the standings of a big field are all transfer; time a small one
+    small = t.createTournament("prepared benchmark standings")
+    try:
+        t.registerPlayers(["Player %d" % i for i in range(16)], small)
+        for (operation, call, arg) in (('playerStandings', t.playerStandings,
+                                        small),
+                                       ('countPlayers', t.countPlayers,
+                                        tournament)):
+            start = time.time()
+            for i in range(players):
+                call(arg)
+            rates.append((operation, players / (time.time() - start)))
+    finally:
+        dropTournament(t, small)
+    return rates
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Simulate tournaments and time the backend.')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        help='field sizes to simulate (default: %s)'
+                        % ' '.join(map(str, SIZES)))
+    parser.add_argument('--rounds', type=int,
+                        help='rounds per event (default: log2 of the field)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dsn', default=None)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--tiebreaks', action='store_true',
+                        help='time the tiebreak query instead')
+    parser.add_argument('--prepared', action='store_true',
+                        help='compare prepared and plain statements instead')
+    args = parser.parse_args(argv[1:])
+
+    options = {}
+    if args.dsn:
+        options['dsn'] = args.dsn
+    if args.prepared:
+        print "%16s %12s %12s %8s" % ("calls per second", "ad hoc", "prepared",
+                                      "speedup")
+        for (operation, adhoc, prepared) in benchPrepared(
+                options, (args.sizes or [1000])[0]):
+            print "%16s %12.0f %12.0f %7.2fx" % (operation, adhoc, prepared,
+                                                 prepared / adhoc)
+        return
+    with Tournament(**options) as t:
+        if args.tiebreaks:
+            print "%8s %8s %10s %14s" % ("players", "matches", "seconds",
+                                         "us per match")
+            for (players, matches, seconds) in benchTiebreaks(
+                    t, args.sizes or (64, 1000, 10000), seed=args.seed):
+                print "%8d %8d %10.4f %14.2f" % (players, matches, seconds,
+                                                 seconds / matches * 1e6)
+            return
+        report = {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'runs': benchEvents(t, args.sizes or SIZES, args.rounds,
+                                args.seed),
+        }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    else:
+        print text
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# cache.py -- a bounded, thread-safe LRU cache for tournament snapshots
+#
+
+import threading
+from collections import OrderedDict
+
+
+class SnapshotCache(object):
+    """Keeps the most recently used results, up to maxsize of them.
+
+    Keys carry the tournament's version, so an entry is never stale: once
+    the tournament changes, callers ask for a new key and the old entry
+    simply ages out.
+
+    Args:
+      maxsize: the most entries kept across all tournaments; 0 turns the
+        cache off.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Returns the value cached under key, computing it on a miss.
+
+        compute() runs outside the lock, so a slow query does not hold up
+        other threads; if two miss at once both compute and the later one
+        is kept.
+        """
+        with self._lock:
+            if key in self._entries:
+                value = self._entries.pop(key)
+                self._entries[key] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute()
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the counters as a dict, for monitoring."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# eventlog.py -- rebuild a tournament's standings from its event log
+#
+# Every registration, withdrawal, result and correction is appended to the
+# events table by triggers, in the same transaction as the change (see
+# tournament.sql). Replaying one tournament's log is a single index-ordered
+# pass that never touches players or matches, so standings can be audited or
+# rebuilt after a problem without scanning either:
+#
+#   python eventlog.py --tournament 3            # report any differences
+#   python eventlog.py --tournament 3 --rebuild  # and write the log's version
+#
+
+import argparse
+import sys
+
+from queries import BYE, DEFAULT_TOURNAMENT, DRAW
+
+
+# one tournament's log, oldest first, straight off its primary key
+EVENTS_SQL = """
+    SELECT kind, player, winner, loser, result
+      FROM events
+     WHERE tournament = %s
+     ORDER BY id
+"""
+
+STORED_SQL = """
+    SELECT player, wins, losses, draws, byes, matches
+      FROM standings
+     WHERE tournament = %s
+"""
+
+
+def _count(standings, winner, loser, result, sign):
+    """Adds or takes away one result, the way count_match() does."""
+    decisive = sign * (result != DRAW)
+    drawn = sign * (result == DRAW)
+    row = standings.get(winner)
+    if row is not None:
+        row[0] += decisive
+        row[2] += drawn
+        row[3] += sign * (result == BYE)
+        row[4] += sign
+    row = standings.get(loser)
+    if row is not None:
+        row[1] += decisive
+        row[2] += drawn
+        row[4] += sign
+
+
+def replay(events):
+    """Folds a tournament's events into standings, in one pass.
+
+    Args:
+      events: (kind, player, winner, loser, result) rows in log order,
+        consumed as they arrive.
+
+    Returns:
+      A dict of player id to a [wins, losses, draws, byes, matches] list,
+      for every player still registered at the end of the log.
+    """
+    standings = {}
+    for (kind, player, winner, loser, result) in events:
+        if kind == 'register':
+            standings[player] = [0, 0, 0, 0, 0]
+        elif kind == 'withdraw':
+            standings.pop(player, None)
+        else:
+            _count(standings, winner, loser, result,
+                   -1 if kind == 'void' else 1)
+    return standings
+
+
+def replayStandings(conn, tournament, itersize=10000):
+    """Replays a tournament's log straight from the database.
+
+    The log is read through a named cursor, itersize rows at a time, so
+    memory use grows with the number of players, not of events.
+    """
+    c = conn.cursor(name='events_%s' % tournament)
+    c.itersize = itersize
+    c.execute(EVENTS_SQL, (tournament,))
+    standings = replay(c)
+    c.close()
+    return standings
+
+
+def storedStandings(conn, tournament):
+    """Returns the standings table's rows for a tournament, like replay()."""
+    c = conn.cursor()
+    c.execute(STORED_SQL, (tournament,))
+    standings = dict((row[0], list(row[1:])) for row in c)
+    c.close()
+    return standings
+
+
+def differences(logged, stored):
+    """Compares replayed and stored standings.
+
+    Returns a list of (player, logged, stored) tuples, sorted by player, for
+    every player whose rows differ; a missing row is None.
+    """
+    return [(pid, logged.get(pid), stored.get(pid))
+            for pid in sorted(set(logged) | set(stored))
+            if logged.get(pid) != stored.get(pid)]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Check a tournament's standings against its event log.")
+    parser.add_argument('--tournament', type=int, default=DEFAULT_TOURNAMENT)
+    parser.add_argument('--rebuild', action='store_true',
+                        help="replace the standings with the log's version")
+    parser.add_argument('--dsn', default=None)
+    args = parser.parse_args(argv[1:])
+
+    from tournament import Tournament
+    options = {'pooled': False}
+    if args.dsn:
+        options['dsn'] = args.dsn
+    with Tournament(**options) as t:
+        found = t.auditStandings(args.tournament)
+        for (pid, logged, stored) in found:
+            print "player %s: log %s, standings %s" % (pid, logged, stored)
+        print "%d players differ" % len(found)
+        if args.rebuild and found:
+            t.rebuildStandings(args.tournament)
+            print "standings rebuilt from the log"
+
+
+if __name__ == '__main__':
+    main(sys.argv)
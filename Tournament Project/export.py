@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# export.py -- write a tournament's standings out as CSV or JSON lines
+#
+# The writers take any iterable of standings rows and write each one as it
+# arrives, so fed from iterStandings() an export of any size runs in
+# constant memory:
+#
+#   python export.py --tournament 3 --format jsonl --tiebreaks buchholz > out
+#
+
+import argparse
+import csv
+import json
+import sys
+from decimal import Decimal
+
+from queries import DEFAULT_TOURNAMENT
+
+
+COLUMNS = ('id', 'name', 'wins', 'matches')
+
+
+def _plain(value):
+    """Tiebreak columns come back as Decimal, which json cannot write."""
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def writeCSV(out, rows, tiebreaks=(), header=True):
+    """Writes standings rows to a file as CSV; returns the number written."""
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(COLUMNS + tuple(tiebreaks))
+    count = 0
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        count += 1
+    return count
+
+
+def writeJSONLines(out, rows, tiebreaks=()):
+    """Writes standings rows to a file as one JSON object per line.
+
+    Returns the number of rows written.
+    """
+    columns = COLUMNS + tuple(tiebreaks)
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, map(_plain, row))),
+                             sort_keys=True))
+        out.write('\n')
+        count += 1
+    return count
+
+
+WRITERS = {
+    'csv': writeCSV,
+    'jsonl': writeJSONLines,
+}
+
+
+def exportStandings(t, out, tournament=DEFAULT_TOURNAMENT, format='csv',
+                    tiebreaks=(), batch_size=1000):
+    """Streams one tournament's standings from t into out.
+
+    Args:
+      t: a Tournament, or any backend with iterStandings().
+      out: a file open for writing.
+      tournament: the id of the tournament to export.
+      format: 'csv' or 'jsonl'.
+      tiebreaks: tiebreak columns to add, as for playerStandings().
+      batch_size: the number of rows fetched from the database at a time.
+
+    Returns:
+      The number of players written.
+    """
+    try:
+        write = WRITERS[format]
+    except KeyError:
+        raise ValueError("unknown format %r; choose from %s"
+                         % (format, ", ".join(sorted(WRITERS))))
+    rows = t.iterStandings(tournament, tiebreaks, batch_size)
+    return write(out, rows, tiebreaks)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Write a tournament's standings to standard output.")
+    parser.add_argument('--tournament', type=int, default=DEFAULT_TOURNAMENT)
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--tiebreaks', nargs='*', default=[])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dsn', default=None)
+    args = parser.parse_args(argv[1:])
+
+    from tournament import Tournament
+    options = {'pooled': False}
+    if args.dsn:
+        options['dsn'] = args.dsn
+    with Tournament(**options) as t:
+        exportStandings(t, sys.stdout, args.tournament, args.format,
+                        args.tiebreaks, args.batch_size)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# instrument.py -- timing hooks around tournament.py's SQL and public calls
+#
+# Register a Hook and switch instrumentation on to hear about every
+# statement a Tournament sends and every public call it answers:
+#
+#   stats = Aggregator()
+#   addHook(stats)
+#   enable()
+#   ...
+#   print stats.report()
+#
+# While disabled, which is the default, each statement and call costs a
+# single flag check.
+#
+
+import math
+import threading
+import time
+from functools import wraps
+
+import psycopg2.extensions
+
+
+_hooks = []
+
+# True only while enabled with at least one hook registered
+_active = False
+
+_enabled = False
+
+# per thread: how deep in public calls we are, and how many statements the
+# outermost one has sent so far
+_calls = threading.local()
+
+
+class Hook(object):
+    """Receives timings; override either or both methods."""
+
+    def statement(self, query, rowcount, seconds):
+        """Called after each SQL statement with its text and row count."""
+
+    def call(self, function, seconds, statements):
+        """Called after each public call with the statements it sent.
+
+        Only the outermost call is reported, so reportMatch() shows up once
+        and not again for the reportMatches() it makes.
+        """
+
+
+def _update():
+    global _active
+    _active = _enabled and bool(_hooks)
+
+
+def addHook(hook):
+    _hooks.append(hook)
+    _update()
+
+
+def removeHook(hook):
+    _hooks.remove(hook)
+    _update()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    _update()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _update()
+
+
+def isEnabled():
+    return _enabled
+
+
+def _statement(query, rowcount, seconds):
+    if getattr(_calls, 'depth', 0):
+        _calls.statements += 1
+    for hook in _hooks:
+        hook.statement(query, rowcount, seconds)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """A cursor that reports every statement it sends to the hooks."""
+
+    def execute(self, query, vars=None):
+        if not _active:
+            return super(InstrumentedCursor, self).execute(query, vars)
+        start = time.time()
+        try:
+            return super(InstrumentedCursor, self).execute(query, vars)
+        finally:
+            _statement(query, self.rowcount, time.time() - start)
+
+    def executemany(self, query, vars_list):
+        if not _active:
+            return super(InstrumentedCursor, self).executemany(query,
+                                                               vars_list)
+        start = time.time()
+        try:
+            return super(InstrumentedCursor, self).executemany(query,
+                                                               vars_list)
+        finally:
+            _statement(query, self.rowcount, time.time() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        if not _active:
+            return super(InstrumentedCursor, self).copy_expert(sql, file,
+                                                               size)
+        start = time.time()
+        try:
+            return super(InstrumentedCursor, self).copy_expert(sql, file,
+                                                               size)
+        finally:
+            _statement(sql, self.rowcount, time.time() - start)
+
+
+def timed(fn):
+    """Reports each outermost call of fn to the hooks."""
+    name = fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return fn(*args, **kwargs)
+        depth = getattr(_calls, 'depth', 0)
+        if depth == 0:
+            _calls.statements = 0
+        _calls.depth = depth + 1
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _calls.depth = depth
+            if depth == 0:
+                elapsed = time.time() - start
+                for hook in _hooks:
+                    hook.call(name, elapsed, _calls.statements)
+    return wrapper
+
+
+def percentile(ordered, pct):
+    """Returns the nearest-rank percentile of an already sorted list."""
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class Aggregator(Hook):
+    """Collects every call's wall time and statement count by function."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def call(self, function, seconds, statements):
+        with self._lock:
+            self.samples.setdefault(function, []).append((seconds, statements))
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def report(self):
+        """Summarises every function as percentiles in milliseconds."""
+        with self._lock:
+            samples = dict(self.samples)
+        report = {}
+        for function, calls in sorted(samples.items()):
+            times = sorted(elapsed for (elapsed, statements) in calls)
+            report[function] = {
+                'calls': len(calls),
+                'p50_ms': percentile(times, 50) * 1000,
+                'p95_ms': percentile(times, 95) * 1000,
+                'p99_ms': percentile(times, 99) * 1000,
+                'max_ms': times[-1] * 1000,
+                'total_s': sum(times),
+                'queries_per_call': (sum(s for (e, s) in calls) /
+                                     float(len(calls))),
+            }
+        return report
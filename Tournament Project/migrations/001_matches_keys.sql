@@ -0,0 +1,109 @@
+-- Brings a tournament database created by an earlier tournament.sql up to
+-- the current schema without losing any players or matches.
+--
+-- Run it once against the existing database: psql tournament -f migrations/001_matches_keys.sql
+-- It is safe to run again; every step checks whether it has already happened.
+
+BEGIN;
+
+-- the old standings views are replaced by the standings table below
+DROP VIEW IF EXISTS PlayerStandings;
+DROP VIEW IF EXISTS StandingsWithMatches;
+DROP VIEW IF EXISTS Standings;
+DROP VIEW IF EXISTS SumMatches;
+DROP VIEW IF EXISTS Losers;
+DROP VIEW IF EXISTS Winners;
+DROP VIEW IF EXISTS JoinAll;
+
+-- new match columns; existing matches belong to tournament 1 with no round
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS draw boolean NOT NULL DEFAULT false;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS tournament int NOT NULL DEFAULT 1;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS round int;
+
+-- matches.id was a bare serial; make it the primary key
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                    WHERE conrelid = 'matches'::regclass AND contype = 'p') THEN
+        ALTER TABLE matches ADD PRIMARY KEY (id);
+    END IF;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS matches_winner ON matches (tournament, winner, loser);
+CREATE INDEX IF NOT EXISTS matches_loser ON matches (tournament, loser, winner);
+
+-- standings table and its triggers, as in tournament.sql
+CREATE TABLE IF NOT EXISTS standings (player int primary key references players (id) ON DELETE CASCADE,
+                                      wins int NOT NULL DEFAULT 0,
+                                      losses int NOT NULL DEFAULT 0,
+                                      draws int NOT NULL DEFAULT 0,
+                                      matches int NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS standings_rank ON standings (wins DESC, player);
+
+CREATE OR REPLACE FUNCTION add_standing() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO standings (player) VALUES (NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_match(winner int, loser int, draw boolean, sign int) RETURNS void AS $$
+BEGIN
+    UPDATE standings
+       SET wins = wins + sign * (NOT draw)::int,
+           draws = draws + sign * draw::int,
+           matches = matches + sign
+     WHERE player = winner;
+    UPDATE standings
+       SET losses = losses + sign * (NOT draw)::int,
+           draws = draws + sign * draw::int,
+           matches = matches + sign
+     WHERE player = loser;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_standings() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM count_match(OLD.winner, OLD.loser, OLD.draw, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM count_match(NEW.winner, NEW.loser, NEW.draw, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS players_standing ON players;
+CREATE TRIGGER players_standing AFTER INSERT ON players
+    FOR EACH ROW EXECUTE PROCEDURE add_standing();
+
+DROP TRIGGER IF EXISTS matches_standings ON matches;
+CREATE TRIGGER matches_standings AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE update_standings();
+
+-- rebuild every standings row from the match history in one pass
+DELETE FROM standings;
+INSERT INTO standings (player, wins, losses, draws, matches)
+SELECT players.id,
+       count(*) FILTER (WHERE results.won AND NOT results.draw),
+       count(*) FILTER (WHERE NOT results.won AND NOT results.draw),
+       count(*) FILTER (WHERE results.draw),
+       count(results.won)
+  FROM players
+  LEFT JOIN (SELECT winner AS player, true AS won, draw FROM matches
+             UNION ALL
+             SELECT loser, false, draw FROM matches) AS results
+    ON results.player = players.id
+ GROUP BY players.id;
+
+CREATE VIEW PlayerStandings AS SELECT players.id, players.name, standings.wins, standings.matches
+      FROM standings
+      JOIN players ON players.id = standings.player
+  ORDER BY standings.wins DESC, standings.player;
+
+ANALYZE matches;
+ANALYZE standings;
+
+COMMIT;
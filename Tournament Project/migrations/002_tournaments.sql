@@ -0,0 +1,82 @@
+-- Adds tournaments and moves matches into a table partitioned by tournament.
+-- Everything already in the database becomes tournament 1.
+--
+-- Needs PostgreSQL 11 or later. Run it after 001_matches_keys.sql:
+-- psql tournament -f migrations/002_tournaments.sql
+
+BEGIN;
+
+CREATE TABLE tournaments (id serial primary key,
+                          name text,
+                          archived boolean NOT NULL DEFAULT false);
+
+ALTER TABLE players ADD COLUMN tournament int NOT NULL DEFAULT 1;
+CREATE INDEX players_tournament ON players (tournament);
+
+DROP VIEW PlayerStandings;
+ALTER TABLE standings ADD COLUMN tournament int NOT NULL DEFAULT 1;
+ALTER TABLE standings ALTER COLUMN tournament DROP DEFAULT;
+DROP INDEX standings_rank;
+CREATE INDEX standings_rank ON standings (tournament, wins DESC, player);
+
+CREATE OR REPLACE FUNCTION add_standing() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO standings (player, tournament) VALUES (NEW.id, NEW.tournament);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- swap the plain matches table for a partitioned one; the old rows are
+-- copied across with the standings trigger out of the way
+ALTER TABLE matches RENAME TO matches_old;
+ALTER INDEX matches_winner RENAME TO matches_old_winner;
+ALTER INDEX matches_loser RENAME TO matches_old_loser;
+
+CREATE TABLE matches (id serial,
+                      tournament int NOT NULL DEFAULT 1,
+                      round int,
+                      winner int references players (id),
+                      loser int references players (id),
+                      draw boolean NOT NULL DEFAULT false,
+                      primary key (tournament, id))
+    PARTITION BY LIST (tournament);
+CREATE INDEX matches_winner ON matches (tournament, winner, loser);
+CREATE INDEX matches_loser ON matches (tournament, loser, winner);
+
+CREATE FUNCTION create_tournament(tname text) RETURNS int AS $$
+DECLARE
+    tid int;
+BEGIN
+    INSERT INTO tournaments (name) VALUES (tname) RETURNING id INTO tid;
+    EXECUTE format('CREATE TABLE matches_%s PARTITION OF matches FOR VALUES IN (%s)', tid, tid);
+    RETURN tid;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION archive_tournament(tid int) RETURNS void AS $$
+BEGIN
+    EXECUTE format('ALTER TABLE matches DETACH PARTITION matches_%s', tid);
+    UPDATE tournaments SET archived = true WHERE id = tid;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_tournament('default');
+ALTER TABLE players ADD FOREIGN KEY (tournament) REFERENCES tournaments (id);
+
+INSERT INTO matches (id, tournament, round, winner, loser, draw)
+SELECT id, tournament, round, winner, loser, draw FROM matches_old;
+SELECT setval(pg_get_serial_sequence('matches', 'id'),
+              coalesce((SELECT max(id) FROM matches_old), 0) + 1, false);
+DROP TABLE matches_old;
+
+CREATE TRIGGER matches_standings AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE update_standings();
+
+CREATE VIEW PlayerStandings AS SELECT players.id, players.name, standings.wins, standings.matches, standings.tournament
+      FROM standings
+      JOIN players ON players.id = standings.player
+  ORDER BY standings.tournament, standings.wins DESC, standings.player;
+
+ANALYZE matches;
+
+COMMIT;
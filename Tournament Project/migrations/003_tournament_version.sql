@@ -0,0 +1,5 @@
+-- Adds the version counter that tells cached standings and pairings when a
+-- tournament has changed. Run it after 002_tournaments.sql:
+-- psql tournament -f migrations/003_tournament_version.sql
+
+ALTER TABLE tournaments ADD COLUMN version int NOT NULL DEFAULT 0;
@@ -0,0 +1,6 @@
+-- Adds Elo ratings to players. Everyone starts from 1500; run
+-- Tournament.recalculateRatings() afterwards to rate existing matches.
+-- Run it after 003_tournament_version.sql:
+-- psql tournament -f migrations/004_ratings.sql
+
+ALTER TABLE players ADD COLUMN rating float8 NOT NULL DEFAULT 1500;
@@ -0,0 +1,53 @@
+-- Replaces matches.draw with an explicit result: 'win', 'draw' or 'bye'.
+-- Byes are recorded as matches with no loser and counted in standings.
+-- Run it after 004_ratings.sql:
+-- psql tournament -f migrations/005_match_results.sql
+
+BEGIN;
+
+CREATE TYPE match_result AS ENUM ('win', 'draw', 'bye');
+
+ALTER TABLE standings ADD COLUMN byes int NOT NULL DEFAULT 0;
+
+-- the standings trigger is rebuilt around the new column, so it is kept out
+-- of the way while existing draws are converted
+DROP TRIGGER matches_standings ON matches;
+
+ALTER TABLE matches ADD COLUMN result match_result NOT NULL DEFAULT 'win';
+UPDATE matches SET result = 'draw' WHERE draw;
+ALTER TABLE matches DROP COLUMN draw;
+ALTER TABLE matches ADD CHECK ((result = 'bye') = (loser IS NULL));
+
+DROP FUNCTION count_match(int, int, boolean, int);
+CREATE FUNCTION count_match(winner int, loser int, result match_result, sign int) RETURNS void AS $$
+BEGIN
+    UPDATE standings
+       SET wins = wins + sign * (result <> 'draw')::int,
+           draws = draws + sign * (result = 'draw')::int,
+           byes = byes + sign * (result = 'bye')::int,
+           matches = matches + sign
+     WHERE player = winner;
+    UPDATE standings
+       SET losses = losses + sign * (result <> 'draw')::int,
+           draws = draws + sign * (result = 'draw')::int,
+           matches = matches + sign
+     WHERE player = loser;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_standings() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM count_match(OLD.winner, OLD.loser, OLD.result, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM count_match(NEW.winner, NEW.loser, NEW.result, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER matches_standings AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE update_standings();
+
+COMMIT;
@@ -0,0 +1,63 @@
+-- Adds the append-only event log. Existing players and matches are logged
+-- as registrations and results, in id order, so the log can rebuild the
+-- standings of events already under way. Run it after 005_match_results.sql:
+-- psql tournament -f migrations/006_event_log.sql
+
+BEGIN;
+
+CREATE TABLE events (id bigserial,
+                     tournament int NOT NULL,
+                     logged_at timestamptz NOT NULL DEFAULT now(),
+                     kind text NOT NULL CHECK (kind IN ('register', 'withdraw', 'result',
+                                                        'void', 'correction')),
+                     player int,
+                     name text,
+                     match int,
+                     round int,
+                     winner int,
+                     loser int,
+                     result match_result,
+                     primary key (tournament, id));
+
+INSERT INTO events (tournament, kind, player, name)
+SELECT tournament, 'register', id, name FROM players ORDER BY id;
+
+INSERT INTO events (tournament, kind, match, round, winner, loser, result)
+SELECT tournament, 'result', id, round, winner, loser, result
+  FROM matches ORDER BY id;
+
+CREATE FUNCTION log_player() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO events (tournament, kind, player, name)
+        VALUES (NEW.tournament, 'register', NEW.id, NEW.name);
+    ELSE
+        INSERT INTO events (tournament, kind, player, name)
+        VALUES (OLD.tournament, 'withdraw', OLD.id, OLD.name);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER players_log AFTER INSERT OR DELETE ON players
+    FOR EACH ROW EXECUTE PROCEDURE log_player();
+
+CREATE FUNCTION log_match() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO events (tournament, kind, match, round, winner, loser, result)
+        VALUES (OLD.tournament, 'void', OLD.id, OLD.round, OLD.winner, OLD.loser, OLD.result);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO events (tournament, kind, match, round, winner, loser, result)
+        VALUES (NEW.tournament, CASE TG_OP WHEN 'INSERT' THEN 'result' ELSE 'correction' END,
+                NEW.id, NEW.round, NEW.winner, NEW.loser, NEW.result);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER matches_log AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE log_match();
+
+COMMIT;
@@ -0,0 +1,6 @@
+-- Lets players start a tournament at a rating of their own. Everyone already
+-- registered started from 1500, so that is their initial rating.
+-- Run it after 006_event_log.sql:
+-- psql tournament -f migrations/007_initial_ratings.sql
+
+ALTER TABLE players ADD COLUMN initial_rating float8 NOT NULL DEFAULT 1500;
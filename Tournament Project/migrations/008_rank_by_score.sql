@@ -0,0 +1,11 @@
+-- Ranks standings by score, a win counting as two draws, the same order the
+-- pairing engine uses. Run it after 007_initial_ratings.sql:
+-- psql tournament -f migrations/008_rank_by_score.sql
+
+DROP INDEX standings_rank;
+CREATE INDEX standings_rank ON standings (tournament, (2 * wins + draws) DESC, player);
+
+CREATE OR REPLACE VIEW PlayerStandings AS SELECT players.id, players.name, standings.wins, standings.matches, standings.tournament, standings.draws
+      FROM standings
+      JOIN players ON players.id = standings.player
+  ORDER BY standings.tournament, 2 * standings.wins + standings.draws DESC, standings.player;
@@ -0,0 +1,28 @@
+-- Makes matches' player keys include the tournament. Deleting a player used
+-- to check winner and loser without it, scanning every tournament's
+-- partition; now the check stays in the player's own. Run it after
+-- 008_rank_by_score.sql:
+-- psql tournament -f migrations/009_match_player_keys.sql
+
+BEGIN;
+
+ALTER TABLE players ADD UNIQUE (tournament, id);
+
+-- the old single-column keys, whatever they were named
+DO $$
+DECLARE
+    old record;
+BEGIN
+    FOR old IN SELECT conname FROM pg_constraint
+                WHERE conrelid = 'matches'::regclass AND contype = 'f'
+                  AND confrelid = 'players'::regclass LOOP
+        EXECUTE format('ALTER TABLE matches DROP CONSTRAINT %I', old.conname);
+    END LOOP;
+END;
+$$;
+
+ALTER TABLE matches
+    ADD FOREIGN KEY (tournament, winner) REFERENCES players (tournament, id),
+    ADD FOREIGN KEY (tournament, loser) REFERENCES players (tournament, id);
+
+COMMIT;
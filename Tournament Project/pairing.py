@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# pairing.py -- Swiss-system pairing on in-memory standings
+#
+# Players are paired score group by score group, best first. Within a group
+# each player takes the nearest player below them in the standings they have
+# not already played. That settles almost every board in linear time; where
+# it gets stuck, the stuck players and the last few boards of the group are
+# re-paired together with a maximum weight matching, which finds the closest
+# rematch-free pairing if one exists. Anyone left over floats down into the
+# next score group.
+#
+
+from itertools import groupby
+
+from matching import maxWeightMatching
+
+
+# how many places down the standings the greedy pass looks for an opponent
+LOOKAHEAD = 8
+
+# how many boards are reopened around stuck players before matching them
+WINDOW = 16
+
+
+def pairPlayers(ids, scores, opponents, byes=()):
+    """Pairs the next round of a Swiss tournament.
+
+    Args:
+      ids: player ids in standings order, best first.
+      scores: the players' scores, in the same order as ids.
+      opponents: a mapping from a player id to the set of ids they have
+        already played. Players missing from it have played nobody.
+      byes: ids of the players who have already had a bye.
+
+    Returns:
+      A (pairs, bye) tuple. pairs is a list of (id1, id2) tuples with the
+      higher-ranked player first, in standings order. bye is the id of the
+      player sitting out this round, or None if the field is even.
+
+      Rematches are only made when no pairing without them exists, and
+      then no more of them than the match history forces.
+    """
+    if len(ids) != len(scores):
+        raise ValueError("ids and scores must be the same length")
+    rank = dict((pid, i) for i, pid in enumerate(ids))
+    score = dict(zip(ids, scores))
+    field = _Field(rank, score, opponents)
+
+    order = list(ids)
+    bye = None
+    if len(order) % 2:
+        bye = _pickBye(order, byes)
+        order.remove(bye)
+
+    pairs = []
+    carry = []
+    for s, group in groupby(order, key=score.get):
+        groupPairs, carry = field.pairGroup(carry + list(group))
+        pairs.extend(groupPairs)
+    if carry:
+        pairs = field.repairTail(pairs, carry)
+    pairs.sort(key=lambda pair: rank[pair[0]])
+    return pairs, bye
+
+
+def _pickBye(order, byes):
+    """Returns the lowest-ranked player who has not had a bye yet."""
+    byes = set(byes)
+    for pid in reversed(order):
+        if pid not in byes:
+            return pid
+    # everyone has had one; start again from the bottom
+    return order[-1]
+
+
+class _Field(object):
+    """The standings and match history the pairing is worked out from."""
+
+    def __init__(self, rank, score, opponents):
+        self.rank = rank
+        self.score = score
+        self.opponents = opponents
+        # scores are whole or half points; doubling them keeps weights integral
+        top = max([abs(s) for s in score.values()] or [0])
+        self.base = int(2 * top + 1) * 1000 + len(rank) + 1
+
+    def played(self, a, b):
+        return b in self.opponents.get(a, ())
+
+    def weight(self, a, b):
+        """Heavier for players closer together in score, then in rank."""
+        return (self.base
+                - int(round(2 * abs(self.score[a] - self.score[b]))) * 1000
+                - abs(self.rank[a] - self.rank[b]))
+
+    def pairGroup(self, pool):
+        """Pairs a score group, floaters from the group above first.
+
+        Returns the pairs made and the players left to float down.
+        """
+        pairs = []
+        taken = set()
+        stuck = []
+        for i, a in enumerate(pool):
+            if a in taken:
+                continue
+            taken.add(a)
+            for b in pool[i + 1:i + 1 + LOOKAHEAD]:
+                if b not in taken and not self.played(a, b):
+                    taken.add(b)
+                    pairs.append((a, b))
+                    break
+            else:
+                stuck.append(a)
+        if len(stuck) <= len(pool) % 2:
+            return pairs, stuck
+        # reopen the boards nearest the stuck players and match them again
+        return self.rematch(pairs, stuck, WINDOW)
+
+    def rematch(self, pairs, stuck, window, rematches=False):
+        """Re-pairs the stuck players together with up to window boards.
+
+        Returns every pair, old and new, and the players still unpaired.
+        """
+        reopen = set(stuck)
+        kept = []
+        for pair in reversed(pairs):
+            near = min(abs(self.rank[p] - self.rank[s])
+                       for p in pair for s in stuck)
+            if len(reopen) < len(stuck) + 2 * window and near <= 2 * window:
+                reopen.update(pair)
+            else:
+                kept.append(pair)
+        kept.reverse()
+        players = sorted(reopen, key=self.rank.get)
+        # when rematches are allowed, every fresh board carries a bonus worth
+        # more than all the score and rank weights of a whole pairing, so one
+        # rematch fewer always outweighs any closeness in score
+        bonus = self.base * (len(players) // 2 + 1) if rematches else 0
+        edges = []
+        for i, a in enumerate(players):
+            for j in range(i + 1, len(players)):
+                b = players[j]
+                if not self.played(a, b):
+                    edges.append((i, j, bonus + self.weight(a, b)))
+                elif rematches:
+                    edges.append((i, j, 1))
+        mate = maxWeightMatching(edges, maxcardinality=True)
+        mate += [-1] * (len(players) - len(mate))
+        left = []
+        for i, a in enumerate(players):
+            if mate[i] == -1:
+                left.append(a)
+            elif i < mate[i]:
+                kept.append((a, players[mate[i]]))
+        return kept, left
+
+    def repairTail(self, pairs, carry):
+        """Pairs the players left at the bottom of the field.
+
+        Reopens more and more of the boards above them until everyone has a
+        rematch-free opponent; if even the whole field cannot manage that,
+        it is re-paired with the fewest rematches needed.
+        """
+        window = WINDOW
+        while True:
+            everything = window >= len(pairs)
+            if everything:
+                # wide enough to reopen every board, however far up
+                window = len(self.rank)
+            result, left = self.rematch(pairs, carry, window,
+                                        rematches=everything)
+            if not left or everything:
+                return result
+            window *= 4
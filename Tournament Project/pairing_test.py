@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Test cases for pairing.py. These run without a database.
+
+import random
+import time
+
+from matching import maxWeightMatching
+from pairing import pairPlayers
+
+
+def _simulate(players, rounds, seed=0):
+    """Plays out an event with random results; returns the pairing times."""
+    rng = random.Random(seed)
+    ids = list(range(1, players + 1))
+    wins = dict((pid, 0) for pid in ids)
+    opponents = {}
+    byes = set()
+    times = []
+    for rnd in range(rounds):
+        standings = sorted(ids, key=lambda pid: (-wins[pid], pid))
+        start = time.time()
+        pairs, bye = pairPlayers(standings, [wins[p] for p in standings],
+                                 opponents, byes)
+        times.append(time.time() - start)
+        seen = set()
+        for (a, b) in pairs:
+            if a in seen or b in seen or a == b:
+                raise ValueError("A player was paired twice in one round.")
+            seen.update((a, b))
+            if b in opponents.get(a, ()):
+                raise ValueError("Players %s and %s were paired again." % (a, b))
+            opponents.setdefault(a, set()).add(b)
+            opponents.setdefault(b, set()).add(a)
+            wins[rng.choice((a, b))] += 1
+        if bye is not None:
+            if bye in byes:
+                raise ValueError("A player was given a second bye.")
+            seen.add(bye)
+            byes.add(bye)
+            wins[bye] += 1
+        if seen != set(ids):
+            raise ValueError("Every player should be paired or get the bye.")
+    return times
+
+
+def testMatching():
+    edges = [(0, 1, 6), (0, 2, 10), (1, 2, 5), (2, 3, 4), (1, 3, 3)]
+    if maxWeightMatching(edges) != [2, 3, 0, 1]:
+        raise ValueError("maxWeightMatching should find the heaviest matching.")
+    # a heavier edge 1-2 loses to two lighter ones when cardinality counts
+    edges = [(0, 1, 2), (1, 2, 10), (2, 3, 2)]
+    if maxWeightMatching(edges) != [-1, 2, 1, -1]:
+        raise ValueError("maxWeightMatching should prefer weight by default.")
+    if maxWeightMatching(edges, maxcardinality=True) != [1, 0, 3, 2]:
+        raise ValueError("maxcardinality should prefer more pairs.")
+    print "1. maxWeightMatching finds maximum weight matchings."
+
+
+def testFirstRound():
+    pairs, bye = pairPlayers([1, 2, 3, 4], [0, 0, 0, 0], {})
+    if pairs != [(1, 2), (3, 4)] or bye is not None:
+        raise ValueError("Players should be paired with their neighbours.")
+    print "2. The first round pairs neighbours in the standings."
+
+
+def testScoreGroups():
+    opponents = {1: set([2]), 2: set([1]), 3: set([4]), 4: set([3])}
+    pairs, bye = pairPlayers([1, 3, 2, 4], [1, 1, 0, 0], opponents)
+    if pairs != [(1, 3), (2, 4)]:
+        raise ValueError("Players should be paired within their score group.")
+    print "3. Players are paired within their score group."
+
+
+def testNoRematch():
+    # 1 and 2 have met, so the top group must pair across
+    opponents = {1: set([2]), 2: set([1]), 3: set([4]), 4: set([3])}
+    pairs, bye = pairPlayers([1, 2, 3, 4], [1, 1, 1, 1], opponents)
+    if set(pairs) != set([(1, 3), (2, 4)]):
+        raise ValueError("Players who have met should not be paired again.")
+    print "4. Players who have already met are not paired again."
+
+
+def testBye():
+    pairs, bye = pairPlayers([1, 2, 3, 4, 5], [2, 1, 1, 0, 0], {}, byes=[5])
+    if bye != 4:
+        raise ValueError("The bye should go to the lowest-ranked player who "
+                         "has not had one.")
+    if sorted(p for pair in pairs for p in pair) != [1, 2, 3, 5]:
+        raise ValueError("Everyone else should be paired.")
+    print "5. Odd fields give a bye to the lowest player without one."
+
+
+def testForcedRematch():
+    everyone = [1, 2, 3, 4]
+    opponents = dict((p, set(everyone) - set([p])) for p in everyone)
+    pairs, bye = pairPlayers(everyone, [3, 2, 1, 0], opponents)
+    if len(pairs) != 2:
+        raise ValueError("A full pairing should be made even when every pair "
+                         "has met before.")
+    print "6. Rematches are allowed when nothing else is possible."
+
+
+def _fewestRematches(players, opponents):
+    """The fewest rematches any full pairing of players needs, by brute force."""
+    if not players:
+        return 0
+    a = players[0]
+    return min((b in opponents.get(a, ())) +
+               _fewestRematches([p for p in players[1:] if p != b], opponents)
+               for b in players[1:])
+
+
+def testFewestRematches():
+    rng = random.Random(7)
+    for trial in range(300):
+        players = list(range(1, 2 * rng.randint(2, 4) + 1))
+        scores = sorted((rng.randint(0, 6) for p in players), reverse=True)
+        opponents = {}
+        for a in players:
+            for b in players:
+                if a < b and rng.random() < 0.6:
+                    opponents.setdefault(a, set()).add(b)
+                    opponents.setdefault(b, set()).add(a)
+        pairs, bye = pairPlayers(players, scores, opponents)
+        made = sum(b in opponents.get(a, ()) for (a, b) in pairs)
+        if made != _fewestRematches(players, opponents):
+            raise ValueError("%d rematches were made where %d would do."
+                             % (made, _fewestRematches(players, opponents)))
+    print "7. No more rematches are made than the history forces."
+
+
+def testLargeEvent():
+    times = _simulate(10000, 14)
+    if max(times) > 1:
+        raise ValueError("Pairing 10k players should take well under a "
+                         "second, not %.2fs." % max(times))
+    print "8. A 10k-player event pairs each round in %.3fs at worst." % max(times)
+
+
+def testSmallEvents():
+    for players in range(2, 40):
+        _simulate(players, min(players - 1, 6), seed=players)
+    print "9. Small events of every size pair without rematches."
+
+
+if __name__ == '__main__':
+    testMatching()
+    testFirstRound()
+    testScoreGroups()
+    testNoRematch()
+    testBye()
+    testForcedRematch()
+    testFewestRematches()
+    testLargeEvent()
+    testSmallEvents()
+    print "Success!  All tests pass!"
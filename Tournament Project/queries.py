@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#
+# queries.py -- the SQL shared by tournament.py and tournament_aio.py
+#
+# Statements use psycopg2's %s / %(name)s placeholders, which aiopg shares,
+# so the blocking and asyncio clients send exactly the same SQL.
+#
+
+import csv
+
+# the tournament created by tournament.sql, used when no tournament is named
+DEFAULT_TOURNAMENT = 1
+
+# how a match can end; the values of the match_result type in tournament.sql
+WIN = 'win'
+DRAW = 'draw'
+BYE = 'bye'
+RESULTS = (WIN, DRAW, BYE)
+
+CREATE_TOURNAMENT = "SELECT create_tournament(%s)"
+
+ARCHIVE_TOURNAMENT = "SELECT archive_tournament(%s)"
+
+DELETE_MATCHES = "DELETE FROM matches WHERE tournament = %s"
+
+DELETE_PLAYERS = "DELETE FROM players WHERE tournament = %s"
+
+COUNT_PLAYERS = "SELECT COUNT(name) FROM players WHERE tournament = %s"
+
+# a player's rating starts at their initial rating, which deleteMatches()
+# and recalculateRatings() go back to
+REGISTER_PLAYER = ("INSERT INTO players (tournament, name, rating, "
+                   "initial_rating) VALUES (%s, %s, %s, %s) RETURNING id")
+
+# every write to a tournament's players or matches ends with this, in the
+# same transaction, so its version says when cached snapshots went stale
+BUMP_VERSION = "UPDATE tournaments SET version = version + 1 WHERE id = %s"
+
+TOURNAMENT_VERSION = "SELECT version FROM tournaments WHERE id = %s"
+
+PLAYERS_SEQUENCE = "SELECT pg_get_serial_sequence('players', 'id')"
+
+RESERVE_IDS = "SELECT nextval(%s) FROM generate_series(1, %s)"
+
+COPY_PLAYERS = ("COPY players (id, tournament, name, rating, initial_rating) "
+                "FROM STDIN WITH CSV")
+
+PLAYER_NAMES = "SELECT id, name FROM players WHERE tournament = %s"
+
+INITIAL_RATINGS = ("SELECT id, initial_rating FROM players "
+                   "WHERE tournament = %s")
+
+# ratings earned from matches go when the matches do
+RESET_RATINGS = ("UPDATE players SET rating = initial_rating "
+                 "WHERE tournament = %s")
+
+RATINGS = ("SELECT id, name, rating FROM players WHERE tournament = %s "
+           "ORDER BY rating DESC, id")
+
+# names and ratings for a batch of tournaments being paired together
+EVENT_PLAYERS = ("SELECT tournament, id, name, rating FROM players "
+                 "WHERE tournament = ANY(%s)")
+
+# best score first, a win counting as two draws, as the pairing engine ranks
+STANDINGS = ("SELECT id, name, wins, matches FROM playerStandings "
+             "WHERE tournament = %s ORDER BY 2 * wins + draws DESC, id")
+
+# results are bound as a VALUES list and only kept if every player they name
+# is in the tournament (a bye names just one), so the caller can compare
+# rowcount with the batch size
+REPORT_MATCHES = """
+    WITH results (winner, loser, result) AS (VALUES %(values)s)
+    INSERT INTO matches (tournament, round, winner, loser, result)
+    SELECT w.tournament, %%(round)s::int, r.winner, r.loser, r.result
+      FROM results r
+      JOIN players w ON w.id = r.winner AND w.tournament = %%(t)s
+      LEFT JOIN players l ON l.id = r.loser AND l.tournament = %%(t)s
+     WHERE (l.id IS NULL) = (r.loser IS NULL)
+"""
+
+# Elo ratings for a batch already in REPORT_MATCHES, bound the same way. A
+# player sits at only one board per batch, so every board is rated from the
+# ratings before the batch; see ratings.py. Byes have no loser to join, so
+# they leave ratings alone
+RATE_MATCHES = """
+    WITH results (winner, loser, result) AS (VALUES %(values)s),
+    deltas AS (
+        SELECT r.winner, r.loser,
+               %%(k)s * (CASE WHEN r.result = 'draw' THEN 0.5 ELSE 1 END
+                         - 1 / (1 + power(10, (l.rating - w.rating) / 400.0)))
+                 AS delta
+          FROM results r
+          JOIN players w ON w.id = r.winner
+          JOIN players l ON l.id = r.loser
+    )
+    UPDATE players p
+       SET rating = p.rating + CASE WHEN p.id = d.winner THEN d.delta
+                                    ELSE -d.delta END
+      FROM deltas d
+     WHERE p.id IN (d.winner, d.loser)
+"""
+
+# a temporary table for recalculated ratings, copied in and applied at once
+NEW_RATINGS = ("CREATE TEMPORARY TABLE new_ratings (id int, rating float8) "
+               "ON COMMIT DROP")
+
+COPY_RATINGS = "COPY new_ratings (id, rating) FROM STDIN WITH CSV"
+
+APPLY_RATINGS = ("UPDATE players p SET rating = n.rating FROM new_ratings n "
+                 "WHERE p.id = n.id")
+
+DELETE_STANDINGS = "DELETE FROM standings WHERE tournament = %s"
+
+COPY_STANDINGS = ("COPY standings (player, tournament, wins, losses, draws, "
+                  "byes, matches) FROM STDIN WITH CSV")
+
+# the whole history in the order it was reported, for replaying ratings
+MATCH_HISTORY = ("SELECT winner, loser, result FROM matches "
+                 "WHERE tournament = %s ORDER BY id")
+
+# Tiebreak columns playerStandings() can add, each computed from tb below:
+#   buchholz: the sum of the player's opponents' scores
+#   sonneborn_berger: opponents' scores weighted by the player's result
+#     against them (1 for a win, 0.5 for a draw)
+#   omw: the average of the opponents' match win percentages, each taken
+#     as at least one third
+# A bye has no opponent, so it adds to none of them.
+TIEBREAKS = {
+    'buchholz': "coalesce(tb.buchholz, 0)",
+    'sonneborn_berger': "coalesce(tb.sonneborn_berger, 0)",
+    'omw': "coalesce(tb.omw, 0)",
+}
+
+TIEBREAK_SQL = """
+    WITH games AS (
+        SELECT winner AS player, loser AS opponent,
+               CASE WHEN result = 'draw' THEN 0.5 ELSE 1 END AS points
+          FROM matches WHERE tournament = %%(t)s AND result <> 'bye'
+        UNION ALL
+        SELECT loser, winner, CASE WHEN result = 'draw' THEN 0.5 ELSE 0 END
+          FROM matches WHERE tournament = %%(t)s AND result <> 'bye'
+    ), scores AS (
+        SELECT player, wins + 0.5 * draws AS score, matches
+          FROM standings WHERE tournament = %%(t)s
+    ), tb AS (
+        SELECT g.player,
+               sum(o.score) AS buchholz,
+               sum(g.points * o.score) AS sonneborn_berger,
+               avg(greatest(o.score / nullif(o.matches, 0), 1 / 3.0)) AS omw
+          FROM games g
+          JOIN scores o ON o.player = g.opponent
+         GROUP BY g.player
+    )
+    SELECT p.id, p.name, s.wins, s.matches%(columns)s
+      FROM standings s
+      JOIN players p ON p.id = s.player
+      LEFT JOIN tb ON tb.player = s.player
+     WHERE s.tournament = %%(t)s
+     ORDER BY 2 * s.wins + s.draws DESC%(order)s, p.id
+"""
+
+
+def tiebreakQuery(tiebreaks):
+    """Returns the standings query with the named tiebreak columns.
+
+    The query takes one parameter, %(t)s, the tournament id. Raises
+    ValueError for a tiebreak not in TIEBREAKS.
+    """
+    for name in tiebreaks:
+        if name not in TIEBREAKS:
+            raise ValueError("unknown tiebreak %r; choose from %s"
+                             % (name, ", ".join(sorted(TIEBREAKS))))
+    columns = "".join(", " + TIEBREAKS[name] for name in tiebreaks)
+    order = "".join(", %d DESC" % (5 + i) for i in range(len(tiebreaks)))
+    return TIEBREAK_SQL % {'columns': columns, 'order': order}
+
+
+def _matchValues(rows, params):
+    """Binds rows into params; returns the VALUES list naming them."""
+    values = []
+    for i, (winner, loser, result) in enumerate(rows):
+        values.append("(%%(w%d)s::int, %%(l%d)s::int, %%(r%d)s::match_result)"
+                      % (i, i, i))
+        params['w%d' % i] = winner
+        params['l%d' % i] = loser
+        params['r%d' % i] = result
+    return ", ".join(values)
+
+
+def reportMatchesQuery(rows, round, tournament):
+    """Returns the REPORT_MATCHES statement and parameters for some rows."""
+    params = {'round': round, 't': tournament}
+    return REPORT_MATCHES % {'values': _matchValues(rows, params)}, params
+
+
+def rateMatchesQuery(rows, k):
+    """Returns the RATE_MATCHES statement and parameters for some rows."""
+    params = {'k': k}
+    return RATE_MATCHES % {'values': _matchValues(rows, params)}, params
+
+
+def playerRow(row):
+    """Splits a registration row into (name, rating).
+
+    A row is a name on its own, or a sequence whose first column is the name
+    and whose optional second column is the player's initial rating. The
+    rating is None when it is missing or blank.
+    """
+    if isinstance(row, (bytes, type(u''))):
+        return row, None
+    rating = row[1] if len(row) > 1 else None
+    if rating is None or rating == '':
+        return row[0], None
+    return row[0], float(rating)
+
+
+def playerRows(players, header=False):
+    """Reads registerPlayers() input as (name, rating) rows, lazily.
+
+    Args:
+      players: an iterable of rows for playerRow(), or an open CSV file of
+        them.
+      header: skip the first row of the input.
+
+    Returns:
+      An iterator of (name, rating) tuples, rating None where missing.
+    """
+    if hasattr(players, 'read'):
+        players = csv.reader(players)
+    players = iter(players)
+    if header:
+        next(players, None)
+    return (playerRow(row) for row in players)
+
+
+def matchRows(results):
+    """Normalises match results into (winner, loser, result) rows.
+
+    Each result is (winner, loser), (winner, loser, draw) with draw a bool,
+    or (winner, loser, result) with result one of RESULTS. A bye is written
+    (player, None), with or without BYE.
+
+    Raises ValueError for an unknown result, a bye with an opponent or a
+    game without one, or if a player meets themselves or appears in more
+    than one result, since a player can only sit at one board per round.
+    """
+    rows = []
+    seen = set()
+    for row in results:
+        if len(row) == 2:
+            winner, loser = row
+            result = WIN if loser is not None else BYE
+        else:
+            winner, loser, result = row
+        if isinstance(result, bool):
+            result = DRAW if result else WIN
+        if result not in RESULTS:
+            raise ValueError("unknown result %r; choose from %s"
+                             % (result, ", ".join(RESULTS)))
+        if (result == BYE) != (loser is None):
+            raise ValueError("a bye names only the player sitting out, and "
+                             "every other result names both players")
+        if winner == loser:
+            raise ValueError("player %s cannot play themselves" % winner)
+        for player in (winner, loser):
+            if player is None:
+                continue
+            if player in seen:
+                raise ValueError("player %s has more than one result in "
+                                 "this round" % player)
+            seen.add(player)
+        rows.append((winner, loser, result))
+    return rows
+
+
+def rejectedMatches(rowcount, rows, tournament):
+    """The error raised when a batch names players from elsewhere."""
+    return ValueError("reportMatches: %d of %d results name players not "
+                      "registered in tournament %s"
+                      % (len(rows) - rowcount, len(rows), tournament))
+
+
+def teams(pairs, bye, names):
+    """Turns pairPlayers() output into swissPairings() rows."""
+    rows = [(a, names[a], b, names[b]) for (a, b) in pairs]
+    if bye is not None:
+        rows.append((bye, names[bye], None, None))
+    return rows
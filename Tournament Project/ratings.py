@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# ratings.py -- Elo ratings kept alongside the Swiss standings
+#
+# Each result moves the winner up and the loser down by the same amount:
+# K_FACTOR times how much better the winner did than their ratings predicted.
+# The database applies the same rule to every reported batch (see
+# queries.RATE_MATCHES); replay() runs it over a whole history to rebuild
+# ratings from scratch.
+#
+
+from queries import BYE, DRAW
+
+
+# the rating every new player starts from
+INITIAL_RATING = 1500.0
+
+# the most a single result can move a rating
+K_FACTOR = 32
+
+
+def expected(rating, opponent):
+    """Returns the score a player is expected to take from a match, 0 to 1."""
+    return 1 / (1 + 10 ** ((opponent - rating) / 400.0))
+
+
+def rate(rows, ratings, k=K_FACTOR):
+    """Applies (winner, loser, result) rows to a dict of ratings in place.
+
+    Players missing from ratings start at INITIAL_RATING, and byes are
+    skipped. Since nobody plays twice in one batch, rating a batch row by
+    row gives the same answer as the database, which rates it all at once.
+
+    Returns:
+      The ratings dict.
+    """
+    for (winner, loser, result) in rows:
+        if result == BYE:
+            continue
+        w = ratings.get(winner, INITIAL_RATING)
+        l = ratings.get(loser, INITIAL_RATING)
+        delta = k * ((0.5 if result == DRAW else 1.0) - expected(w, l))
+        ratings[winner] = w + delta
+        ratings[loser] = l - delta
+    return ratings
+
+
+def replay(matches, players=(), k=K_FACTOR):
+    """Rebuilds ratings from a match history in a single pass.
+
+    Args:
+      matches: an iterable of (winner, loser, result) tuples, oldest first.
+        It is consumed as it goes, so it can be a server-side cursor.
+      players: ids to include even if they have not played yet, or a dict
+        of player id to the rating they started the tournament with.
+      k: the K factor.
+
+    Returns:
+      A dict of player id to rating.
+    """
+    if isinstance(players, dict):
+        ratings = dict(players)
+    else:
+        ratings = dict((pid, INITIAL_RATING) for pid in players)
+    return rate(matches, ratings, k)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# scheduler.py -- pair the next round of many tournaments at once
+#
+# Standings are loaded a batch of tournaments at a time (see
+# Tournament.loadEvents()) and each event is paired in a pool of worker
+# processes, since pairing a big field is CPU work that threads cannot
+# spread. Results are handed back as each event finishes, while the next
+# batch is still loading.
+#
+
+import multiprocessing
+import Queue
+import time
+from collections import OrderedDict
+
+import queries
+from pairing import pairPlayers
+
+
+# how many tournaments are loaded per round trip to the database
+BATCH_SIZE = 50
+
+# how often, in seconds, to check on the workers while waiting for a result
+POLL_INTERVAL = 1.0
+
+
+def _pairEvent(tournament, model, seeds):
+    """Pairs one event in a worker process.
+
+    Returns (tournament, pairs, bye, seconds, error). Errors are handed back
+    rather than raised, since a raising task would never call back.
+    """
+    start = time.time()
+    try:
+        ids, scores = model.rankedColumns(seeds)
+        pairs, bye = pairPlayers(ids, scores, model.opponents, model.byes)
+    except Exception as e:
+        return (tournament, None, None, time.time() - start, e)
+    return (tournament, pairs, bye, time.time() - start, None)
+
+
+def pairTournaments(t, tournaments, processes=None, batch_size=BATCH_SIZE,
+                    timeout=None):
+    """Pairs the next round of every tournament given, in parallel.
+
+    Args:
+      t: a Tournament, or any backend with loadEvents().
+      tournaments: the ids of the tournaments to pair.
+      processes: the number of worker processes; by default one per CPU.
+      batch_size: the number of tournaments loaded per batch.
+      timeout: the most seconds to wait for the next event to finish; by
+        default there is no limit while the workers are alive.
+
+    Yields:
+      A (tournament, pairings, timings) tuple per event, in the order they
+      finish. pairings is what swissPairings() would return. timings is a
+      dict of seconds: 'load' is the event's share of its batch's load
+      time, 'pair' the time spent pairing it and 'elapsed' the time from
+      the start of the call until it was handed back.
+
+    Raises:
+      RuntimeError: a worker process died, so its event will never be
+        handed back, or no event finished within timeout seconds. The
+        message names the tournaments still waiting.
+    """
+    start = time.time()
+    # each event is paired once, however often it is named
+    tournaments = list(OrderedDict.fromkeys(tournaments))
+    pool = multiprocessing.Pool(processes)
+    workers = _workers(pool)
+    done = Queue.Queue()
+    waiting = {}
+    try:
+        for first in range(0, len(tournaments), batch_size):
+            batch = tournaments[first:first + batch_size]
+            loadStart = time.time()
+            events = t.loadEvents(batch)
+            load = (time.time() - loadStart) / len(batch)
+            for (tournament, model, names, ratings) in events:
+                seeds = None if any(model.matches) else ratings
+                waiting[tournament] = (names, load)
+                pool.apply_async(_pairEvent, (tournament, model, seeds),
+                                 callback=done.put)
+            # hand back whatever finished while this batch was loading
+            while not done.empty():
+                yield _result(done.get_nowait(), waiting, start)
+        while waiting:
+            finished = _next(done, pool, workers, waiting, timeout)
+            yield _result(finished, waiting, start)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _workers(pool):
+    # the pool replaces a worker that dies, silently dropping its task, so
+    # a change in the set of worker processes means a result is lost
+    return set(process.pid for process in pool._pool)
+
+
+def _next(done, pool, workers, waiting, timeout):
+    """Waits for the next event to finish, as long as it still can."""
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        wait = POLL_INTERVAL
+        if deadline is not None:
+            wait = max(0, min(wait, deadline - time.time()))
+        try:
+            return done.get(timeout=wait)
+        except Queue.Empty:
+            pass
+        pending = ", ".join(str(tournament) for tournament in sorted(waiting))
+        if _workers(pool) != workers:
+            raise RuntimeError("a worker process died while pairing "
+                               "tournaments %s" % pending)
+        if deadline is not None and time.time() >= deadline:
+            raise RuntimeError("tournaments %s were not paired within %s "
+                               "seconds" % (pending, timeout))
+
+
+def _result(finished, waiting, start):
+    tournament, pairs, bye, seconds, error = finished
+    names, load = waiting.pop(tournament)
+    if error is not None:
+        raise error
+    timings = {'load': load, 'pair': seconds, 'elapsed': time.time() - start}
+    return (tournament, queries.teams(pairs, bye, names), timings)
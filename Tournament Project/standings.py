@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# standings.py -- compact in-memory standings for one tournament
+#
+
+from array import array
+from itertools import groupby
+
+from queries import BYE, DRAW, WIN
+
+
+# one row per player: standings, plus everyone they have played so far. a
+# bye's missing opponent drops out of the array, but it is counted in byes
+LOAD_SQL = """
+    SELECT s.player, s.wins, s.draws, s.matches, s.byes,
+           coalesce(array_agg(o.opponent) FILTER (WHERE o.opponent IS NOT NULL),
+                    '{}')
+      FROM standings s
+      LEFT JOIN (SELECT winner AS player, loser AS opponent
+                   FROM matches WHERE tournament = %(t)s
+                 UNION ALL
+                 SELECT loser, winner
+                   FROM matches WHERE tournament = %(t)s) o
+        ON o.player = s.player
+     WHERE s.tournament = %(t)s
+     GROUP BY s.player
+     ORDER BY 2 * s.wins + s.draws DESC, s.player
+"""
+
+# the same for several tournaments at once, one after another
+LOAD_MANY_SQL = """
+    SELECT s.tournament, s.player, s.wins, s.draws, s.matches, s.byes,
+           coalesce(array_agg(o.opponent) FILTER (WHERE o.opponent IS NOT NULL),
+                    '{}')
+      FROM standings s
+      LEFT JOIN (SELECT winner AS player, loser AS opponent
+                   FROM matches WHERE tournament = ANY(%(ts)s)
+                 UNION ALL
+                 SELECT loser, winner
+                   FROM matches WHERE tournament = ANY(%(ts)s)) o
+        ON o.player = s.player
+     WHERE s.tournament = ANY(%(ts)s)
+     GROUP BY s.player
+     ORDER BY s.tournament, 2 * s.wins + s.draws DESC, s.player
+"""
+
+
+class Standings(object):
+    """Standings kept as parallel array columns rather than row tuples.
+
+    Row i of every column belongs to player ids[i]; index maps a player id
+    back to its row. Scores are wins (a bye counts as one) plus half a
+    point per draw, byes holds the players who have had a bye, and
+    oppScores holds the sum of each player's opponents' scores (their
+    Buchholz score), kept current as results come in.
+    """
+
+    def __init__(self, tournament=None):
+        self.tournament = tournament
+        self.ids = array('l')
+        self.wins = array('l')
+        self.draws = array('l')
+        self.matches = array('l')
+        self.oppScores = array('d')
+        self.index = {}
+        self.opponents = {}
+        self.byes = set()
+
+    @classmethod
+    def load(cls, conn, tournament, itersize=10000):
+        """Loads one tournament's standings in a single server-side pass.
+
+        Args:
+          conn: an open connection; the named cursor needs a transaction,
+            which is left for the caller to end.
+          tournament: the id of the tournament to load.
+          itersize: the number of rows fetched per round trip.
+        """
+        c = conn.cursor(name='standings_%s' % tournament)
+        c.itersize = itersize
+        c.execute(LOAD_SQL, {'t': tournament})
+        model = cls.fromRows(c, tournament)
+        c.close()
+        return model
+
+    @classmethod
+    def loadMany(cls, conn, tournaments, itersize=10000):
+        """Loads several tournaments' standings in a single query.
+
+        Returns a dict of tournament id to model. Tournaments with no
+        players get an empty model.
+        """
+        c = conn.cursor(name='standings_many')
+        c.itersize = itersize
+        c.execute(LOAD_MANY_SQL, {'ts': list(tournaments)})
+        models = dict((t, cls(t)) for t in tournaments)
+        for tournament, rows in groupby(c, key=lambda row: row[0]):
+            models[tournament] = cls.fromRows((row[1:] for row in rows),
+                                              tournament)
+        c.close()
+        return models
+
+    @classmethod
+    def fromRows(cls, rows, tournament=None):
+        """Builds a model from rows of LOAD_SQL, consumed as they arrive."""
+        model = cls(tournament)
+        for (pid, wins, draws, matches, byes, opponents) in rows:
+            model.addPlayer(pid, wins, draws, matches)
+            model.opponents[pid] = set(opponents)
+            if byes:
+                model.byes.add(pid)
+        score = model.score
+        for i, pid in enumerate(model.ids):
+            model.oppScores[i] = sum(score(o) for o in model.opponents[pid])
+        return model
+
+    def __len__(self):
+        return len(self.ids)
+
+    def addPlayer(self, pid, wins=0, draws=0, matches=0):
+        """Adds a row for a newly registered player."""
+        self.index[pid] = len(self.ids)
+        self.ids.append(pid)
+        self.wins.append(wins)
+        self.draws.append(draws)
+        self.matches.append(matches)
+        self.oppScores.append(0.0)
+        self.opponents[pid] = set()
+
+    def score(self, pid):
+        i = self.index[pid]
+        return self.wins[i] + 0.5 * self.draws[i]
+
+    def recordMatch(self, winner, loser, result=WIN):
+        """Applies one reported result to the columns.
+
+        result is one of queries.RESULTS; for a bye, loser is None.
+        """
+        w = self.index[winner]
+        self.matches[w] += 1
+        # everyone who has played a player shares in their new points
+        if result == BYE:
+            self.wins[w] += 1
+            self.byes.add(winner)
+            for o in self.opponents[winner]:
+                self.oppScores[self.index[o]] += 1.0
+            return
+        l = self.index[loser]
+        self.matches[l] += 1
+        if result == DRAW:
+            self.draws[w] += 1
+            self.draws[l] += 1
+            gains = ((winner, 0.5), (loser, 0.5))
+        else:
+            self.wins[w] += 1
+            gains = ((winner, 1.0),)
+        for pid, points in gains:
+            for o in self.opponents[pid]:
+                self.oppScores[self.index[o]] += points
+        # opponents are counted once however often they meet, as fromRows()
+        # and the SQL Buchholz count them; a rematch's points were passed on
+        # by the loop above
+        if loser not in self.opponents[winner]:
+            self.oppScores[w] += self.score(loser)
+            self.oppScores[l] += self.score(winner)
+            self.opponents[winner].add(loser)
+            self.opponents[loser].add(winner)
+
+    def ranked(self, seeds=None):
+        """Returns the row numbers in standings order, best first.
+
+        Players level on points are ordered by id, or by seeds, a mapping of
+        player id to rating, highest first, when one is given.
+        """
+        wins = self.wins
+        draws = self.draws
+        ids = self.ids
+        if seeds is None:
+            return sorted(range(len(ids)),
+                          key=lambda i: (-(2 * wins[i] + draws[i]), ids[i]))
+        return sorted(range(len(ids)),
+                      key=lambda i: (-(2 * wins[i] + draws[i]),
+                                     -seeds.get(ids[i], 0), ids[i]))
+
+    def rankedColumns(self, seeds=None):
+        """Returns (ids, scores) arrays in standings order for pairing."""
+        order = self.ranked(seeds)
+        ids = array('l', [self.ids[i] for i in order])
+        scores = array('d', [self.wins[i] + 0.5 * self.draws[i]
+                             for i in order])
+        return ids, scores
+
+    def tiebreaks(self, matches):
+        """Works out every tiebreak score in one pass over the matches.
+
+        The same definitions as queries.TIEBREAKS, for storage that has no
+        SQL to do it with.
+
+        Args:
+          matches: an iterable of (winner, loser, result) tuples. Byes
+            have no opponent and add to no tiebreak.
+
+        Returns:
+          A dict mapping each tiebreak name to a dict of player id to score.
+        """
+        score = self.score
+        buchholz = dict((pid, 0.0) for pid in self.ids)
+        sonneborn = dict(buchholz)
+        omwTotal = dict(buchholz)
+        games = dict((pid, 0) for pid in self.ids)
+        for (winner, loser, result) in matches:
+            if result == BYE:
+                continue
+            won = 0.5 if result == DRAW else 1.0
+            for (player, opponent, points) in ((winner, loser, won),
+                                               (loser, winner, 1.0 - won)):
+                oppScore = score(opponent)
+                buchholz[player] += oppScore
+                sonneborn[player] += points * oppScore
+                played = self.matches[self.index[opponent]]
+                omwTotal[player] += max(oppScore / played, 1 / 3.0)
+                games[player] += 1
+        omw = dict((pid, omwTotal[pid] / games[pid] if games[pid] else 0.0)
+                   for pid in self.ids)
+        return {'buchholz': buchholz, 'sonneborn_berger': sonneborn,
+                'omw': omw}
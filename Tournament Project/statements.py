@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# statements.py -- prepared statements for tournament.py's hot paths
+#
+# The statements below are sent on every report, registration, standings
+# read and count. On a PreparingConnection each one is PREPAREd the first
+# time that connection runs it and executed by name from then on, so
+# PostgreSQL parses and plans it once per connection rather than once per
+# call. On any other connection the same SQL is sent as plain text:
+#
+#   c = conn.cursor()
+#   execute(c, 'count_players', (tournament,))
+#
+
+import re
+
+import psycopg2.extensions
+
+from queries import STANDINGS
+
+
+# name -> body, with $n placeholders cast so PostgreSQL can infer their types
+PREPARED = {
+    'count_players': """
+        SELECT COUNT(name) FROM players WHERE tournament = $1::int
+    """,
+    'register_player': """
+        INSERT INTO players (tournament, name, rating, initial_rating)
+        VALUES ($1::int, $2::text, $3::float8, $3::float8)
+        RETURNING id
+    """,
+    'standings': STANDINGS.replace('%s', '$1::int'),
+    'tournament_version': """
+        SELECT version FROM tournaments WHERE id = $1::int
+    """,
+    'bump_version': """
+        UPDATE tournaments SET version = version + 1 WHERE id = $1::int
+        RETURNING version
+    """,
+    # one result, kept only if its players are in the tournament; the
+    # single-row form of queries.REPORT_MATCHES
+    'report_match': """
+        INSERT INTO matches (tournament, round, winner, loser, result)
+        SELECT w.tournament, $2::int, w.id, l.id, $5::match_result
+          FROM players w
+          LEFT JOIN players l ON l.id = $4::int AND l.tournament = $1::int
+         WHERE w.id = $3::int AND w.tournament = $1::int
+           AND (l.id IS NULL) = ($4::int IS NULL)
+    """,
+    # the single-row form of queries.RATE_MATCHES
+    'rate_match': """
+        WITH delta AS (
+            SELECT w.id AS winner, l.id AS loser,
+                   $4::float8 * (CASE WHEN $3::match_result = 'draw'
+                                      THEN 0.5 ELSE 1 END
+                                 - 1 / (1 + power(10, (l.rating - w.rating)
+                                                      / 400.0))) AS delta
+              FROM players w, players l
+             WHERE w.id = $1::int AND l.id = $2::int
+        )
+        UPDATE players p
+           SET rating = p.rating + CASE WHEN p.id = d.winner THEN d.delta
+                                        ELSE -d.delta END
+          FROM delta d
+         WHERE p.id IN (d.winner, d.loser)
+    """,
+}
+
+_PARAM = re.compile(r'\$(\d+)')
+
+
+def _arity(body):
+    return max(int(n) for n in _PARAM.findall(body))
+
+
+# what is sent once a statement is prepared, and what is sent instead on a
+# connection that does not prepare
+EXECUTE = dict((name, "EXECUTE %s (%s)" % (name, ", ".join(["%s"] *
+                                                           _arity(body))))
+               for (name, body) in PREPARED.items())
+
+ADHOC = dict((name, _PARAM.sub(r'%(\1)s', body))
+             for (name, body) in PREPARED.items())
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """A connection that remembers which statements it has prepared.
+
+    Pass it to psycopg2.connect() or a pool as connection_factory. A
+    prepared statement lasts as long as the session and survives rollbacks,
+    so a name is recorded as soon as its PREPARE succeeds; a replacement
+    connection starts with none.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PreparingConnection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def execute(cursor, name, args):
+    """Runs one of the PREPARED statements on a cursor.
+
+    Args:
+      cursor: a cursor; statements are prepared only if its connection is a
+        PreparingConnection.
+      name: the statement's name in PREPARED.
+      args: its parameters, in $1, $2, ... order.
+    """
+    prepared = getattr(cursor.connection, 'prepared', None)
+    if prepared is None:
+        cursor.execute(ADHOC[name], dict((str(i + 1), arg)
+                                         for i, arg in enumerate(args)))
+        return
+    if name not in prepared:
+        cursor.execute("PREPARE %s AS %s" % (name, PREPARED[name]))
+        prepared.add(name)
+    cursor.execute(EXECUTE[name], args)
@@ -1,103 +1,793 @@
 #!/usr/bin/env python
-# 
+#
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import csv
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from StringIO import StringIO
+
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+import queries
+import statements
+from cache import SnapshotCache
+from eventlog import differences, replayStandings, storedStandings
+from instrument import InstrumentedCursor, timed
+from pairing import pairPlayers
+from queries import BYE, DEFAULT_TOURNAMENT, DRAW, TIEBREAKS, WIN
+from ratings import INITIAL_RATING, K_FACTOR, replay
+from standings import Standings
+from statements import PreparingConnection
+
+
+DSN = "dbname=tournament"
 
 
 def connect():
     """Connect to the PostgreSQL database. Returns a database connection."""
-    return psycopg2.connect("dbname=tournament")
-
-def deleteMatches():
-    """Remove all the match records from the database."""
-    conn=connect()
-    c=conn.cursor()
-    c.execute("DELETE FROM matches")
-    conn.commit()
-    conn.close()   
-
-def deletePlayers():
-    """Remove all the player records from the database."""
-    conn=connect()
-    c=conn.cursor()
-    c.execute("DELETE FROM players")
-    conn.commit()
-    conn.close()
-
-def countPlayers():
-    """Returns the number of players currently registered."""
-    conn=connect()
-    c=conn.cursor()
+    return psycopg2.connect(DSN)
+
+
+class Tournament(object):
+    """A handle on the tournament database backed by a connection pool.
+
+    Connections are borrowed from a bounded, thread-safe pool for the length
+    of one call and handed back afterwards, so repeated calls skip the
+    connect and authentication handshake. Each borrowed connection is checked
+    before use and replaced if the server has dropped it.
+
+    Args:
+      dsn: the libpq connection string.
+      minconn: the number of connections opened up front.
+      maxconn: the most connections the pool will ever hold open.
+      pooled: when False no pool is built and every call opens and closes
+        its own connection, exactly like the module-level functions.
+      healthcheck: when True, borrowed connections are pinged with a
+        "SELECT 1" before use instead of only checking their closed flag.
+      cacheSize: how many standings and pairings snapshots to keep, across
+        all tournaments; 0 turns the cache off.
+      prepare: when True, each pooled connection PREPAREs the hot statements
+        in statements.py the first time it runs them and executes them by
+        name afterwards. Unpooled connections never prepare, since they
+        would be closed before the plan could be reused.
+      connectArgs: extra keyword arguments for psycopg2.connect(), such as
+        cursor_factory. Statements only reach instrument.py's hooks through
+        cursors derived from InstrumentedCursor, the default.
+    """
+
+    def __init__(self, dsn=DSN, minconn=1, maxconn=10, pooled=True,
+                 healthcheck=False, cacheSize=128, prepare=True,
+                 **connectArgs):
+        self.dsn = dsn
+        self.healthcheck = healthcheck
+        connectArgs.setdefault('cursor_factory', InstrumentedCursor)
+        if prepare and pooled:
+            connectArgs.setdefault('connection_factory', PreparingConnection)
+        self.connectArgs = connectArgs
+        self._pool = None
+        # standings and pairings by (tournament, ..., version); see _snapshot
+        self.cache = SnapshotCache(cacheSize)
+        # (model, version) pairs by tournament: Standings models kept current
+        # by this handle's writes, and the tournament version each matches
+        self._tracked = {}
+        self._trackLock = threading.Lock()
+        if pooled:
+            self._pool = ThreadedConnectionPool(minconn, maxconn, dsn,
+                                                **connectArgs)
+            # ThreadedConnectionPool raises once maxconn connections are out;
+            # the semaphore makes extra callers wait for a free one instead.
+            self._slots = threading.BoundedSemaphore(maxconn)
+
+    def close(self):
+        """Close every connection held by the pool."""
+        if self._pool is not None:
+            self._pool.closeall()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _alive(self, conn):
+        if conn.closed:
+            return False
+        if not self.healthcheck:
+            return True
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _getconn(self):
+        if self._pool is None:
+            return psycopg2.connect(self.dsn, **self.connectArgs)
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            if not self._alive(conn):
+                # drop the dead connection and open a fresh one in its place
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except (psycopg2.Error, PoolError):
+            self._slots.release()
+            raise
+
+    def _putconn(self, conn):
+        if self._pool is None:
+            conn.close()
+            return
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection for a single transaction.
+
+        Commits when the block exits normally and rolls back if it raises.
+        The connection goes back to the pool either way.
+        """
+        conn = self._getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+
+    @contextmanager
+    def cursor(self, conn=None):
+        """Borrow a cursor inside its own transaction.
+
+        If conn is given the cursor runs on it instead, and committing is
+        left to whoever owns that connection.
+        """
+        if conn is not None:
+            c = conn.cursor()
+            try:
+                yield c
+            finally:
+                c.close()
+            return
+        with self.transaction() as conn:
+            c = conn.cursor()
+            try:
+                yield c
+            finally:
+                c.close()
+
+    @timed
+    def createTournament(self, name):
+        """Starts a new tournament and returns its id."""
+        with self.cursor() as c:
+            c.execute(queries.CREATE_TOURNAMENT, (name,))
+            return c.fetchone()[0]
+
+    @timed
+    def archiveTournament(self, tournament):
+        """Detaches a finished tournament's matches from the live table.
+
+        The matches stay in a standalone matches_<id> table, which can be
+        dumped and dropped without touching any other tournament.
+        """
+        with self.cursor() as c:
+            c.execute(queries.ARCHIVE_TOURNAMENT, (tournament,))
+
+    @timed
+    def loadStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a Standings model of one tournament, read in one pass."""
+        with self.transaction() as conn:
+            return Standings.load(conn, tournament)
+
+    @timed
+    def loadEvents(self, tournaments):
+        """Loads what pairing needs for many tournaments at once.
+
+        The whole batch takes two queries however many tournaments are in
+        it: one for standings and match history, one for names and ratings.
+
+        Returns:
+          A list of (tournament, model, names, ratings) tuples in the order
+          given, where names and ratings are dicts keyed by player id.
+        """
+        tournaments = list(tournaments)
+        names = dict((t, {}) for t in tournaments)
+        ratings = dict((t, {}) for t in tournaments)
+        with self.transaction() as conn:
+            models = Standings.loadMany(conn, tournaments)
+            c = conn.cursor()
+            c.execute(queries.EVENT_PLAYERS, (tournaments,))
+            for (tournament, pid, name, rating) in c:
+                names[tournament][pid] = name
+                ratings[tournament][pid] = rating
+            c.close()
+        return [(t, models[t], names[t], ratings[t]) for t in tournaments]
+
+    @timed
+    def trackStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a Standings model this handle keeps up to date.
+
+        The model is loaded once and then updated in memory by every result
+        and registration reported through this handle, so pairing it again
+        costs no database work. Writes made by anyone else are not seen by
+        the model; once this handle notices one, it stops updating the model
+        and loads a fresh one for the next call.
+        """
+        with self._trackLock:
+            entry = self._tracked.get(tournament)
+        if entry is None:
+            with self.transaction() as conn:
+                entry = self._load(conn, tournament)
+            with self._trackLock:
+                entry = self._tracked.setdefault(tournament, entry)
+        return entry[0]
+
+    def _load(self, conn, tournament):
+        """Returns a fresh (model, version) pair for a tournament.
+
+        The version is read first, so if a write lands in between, the
+        model is newer than its version says and is only ever reloaded
+        early, never trusted late.
+        """
+        version = self._version(conn, tournament)
+        return Standings.load(conn, tournament), version
+
+    def _version(self, conn, tournament):
+        """Returns a tournament's version, or None if it does not exist."""
+        c = conn.cursor()
+        statements.execute(c, 'tournament_version', (tournament,))
+        row = c.fetchone()
+        c.close()
+        return row[0] if row else None
+
+    def _bump(self, c, tournament):
+        """Bumps a tournament's version; returns the new one, if it exists."""
+        statements.execute(c, 'bump_version', (tournament,))
+        row = c.fetchone()
+        return row[0] if row else None
+
+    def _untrack(self, tournament):
+        with self._trackLock:
+            self._tracked.pop(tournament, None)
+
+    def _updateTracked(self, tournament, update, version):
+        """Applies this handle's own write to a tracked model.
+
+        version is the one the write bumped the tournament to. Unless the
+        model was at the version just before it, someone else has written
+        in between, and the model is dropped instead.
+        """
+        with self._trackLock:
+            entry = self._tracked.get(tournament)
+            if entry is None:
+                return
+            model, seen = entry
+            if version is not None and seen == version - 1:
+                update(model)
+                self._tracked[tournament] = (model, version)
+            else:
+                del self._tracked[tournament]
+
+    @timed
+    def deleteMatches(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the match records from one tournament.
+
+        Ratings go back to each player's initial rating in the same
+        transaction, since they were earned from those matches.
+        """
+        with self.cursor() as c:
+            c.execute(queries.DELETE_MATCHES, (tournament,))
+            c.execute(queries.RESET_RATINGS, (tournament,))
+            statements.execute(c, 'bump_version', (tournament,))
+        self._untrack(tournament)
+
+    @timed
+    def deletePlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the player records from one tournament."""
+        with self.cursor() as c:
+            c.execute(queries.DELETE_PLAYERS, (tournament,))
+            statements.execute(c, 'bump_version', (tournament,))
+        self._untrack(tournament)
+
+    @timed
+    def countPlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns the number of players currently registered."""
+        with self.cursor() as c:
+            #counts the number of names
+            statements.execute(c, 'count_players', (tournament,))
+            return c.fetchone()[0]
+
+    @timed
+    def registerPlayer(self, pname, tournament=DEFAULT_TOURNAMENT,
+                       rating=None):
+        """Adds a player to the tournament database.
+
+        Args:
+          name: the player's full name (need not be unique).
+          tournament: the id of the tournament the player enters.
+          rating: the player's rating coming in, used to seed the first
+            round; INITIAL_RATING by default.
+
+        Returns:
+          The new player's id.
+        """
+        if rating is None:
+            rating = INITIAL_RATING
+        with self.cursor() as c:
+            statements.execute(c, 'register_player',
+                               (tournament, pname, rating))
+            pid = c.fetchone()[0]
+            version = self._bump(c, tournament)
+        self._updateTracked(tournament, lambda model: model.addPlayer(pid),
+                            version)
+        return pid
+
+    @timed
+    def registerPlayers(self, players, tournament=DEFAULT_TOURNAMENT,
+                        conn=None, header=False, chunksize=10000):
+        """Adds many players at once with COPY.
+
+        Ids are reserved from the players sequence up front, so they can be
+        returned in input order even though COPY itself reports nothing back.
+        The input is streamed through in chunks and never held in full.
+
+        Args:
+          players: an iterable of names, of rows whose first column is the
+            name and whose optional second column is the player's initial
+            rating, or an open CSV file of such rows. A missing or blank
+            rating means INITIAL_RATING.
+          tournament: the id of the tournament the players enter.
+          conn: an open connection to run in; the caller commits. By default
+            the whole import runs in one transaction of its own.
+          header: skip the first row of the input.
+          chunksize: the number of rows sent per COPY.
+
+        Returns:
+          A list of the new players' ids, in input order.
+        """
+        players = queries.playerRows(players, header)
+        ids = []
+        with self.cursor(conn) as c:
+            c.execute(queries.PLAYERS_SEQUENCE)
+            sequence = c.fetchone()[0]
+            while True:
+                rows = [_playerRow(name, rating)
+                        for (name, rating) in islice(players, chunksize)]
+                if not rows:
+                    break
+                c.execute(queries.RESERVE_IDS, (sequence, len(rows)))
+                chunk = sorted(row[0] for row in c.fetchall())
+                buf = StringIO()
+                csv.writer(buf).writerows((i, tournament, name, rating, rating)
+                                          for i, (name, rating)
+                                          in zip(chunk, rows))
+                buf.seek(0)
+                c.copy_expert(queries.COPY_PLAYERS, buf)
+                ids.extend(chunk)
+            version = self._bump(c, tournament)
+        if conn is None:
+            def add(model):
+                for pid in ids:
+                    model.addPlayer(pid)
+            self._updateTracked(tournament, add, version)
+        else:
+            # the caller may still roll back, so reload on next use
+            self._untrack(tournament)
+        return ids
+
+    @timed
+    def playerStandings(self, tournament=DEFAULT_TOURNAMENT, tiebreaks=()):
+        """Returns a list of (id, name, wins, matches) tuples sorted by score.
+
+        A win scores two draws, the order swissPairings() pairs in. Each
+        tiebreak named adds a column to every row, in the order given,
+        and breaks ties in score in that order. All of them are worked out
+        for the whole field by a single query over the tournament's matches.
+        Until the tournament changes, asking again is answered from the cache.
+        """
+        query = queries.tiebreakQuery(tiebreaks) if tiebreaks else None
+        with self.transaction() as conn:
+            def compute():
+                c = conn.cursor()
+                if query is None:
+                    statements.execute(c, 'standings', (tournament,))
+                else:
+                    c.execute(query, {'t': tournament})
+                rows = c.fetchall()
+                c.close()
+                return rows
+            return list(self._snapshot(conn, tournament,
+                                       ('standings', tuple(tiebreaks)),
+                                       compute))
+
+    def iterStandings(self, tournament=DEFAULT_TOURNAMENT, tiebreaks=(),
+                      batch_size=1000):
+        """Yields the rows of playerStandings() one at a time.
+
+        The rows come from a named server-side cursor batch_size at a time,
+        so however big the field, only one batch is ever held in memory. The
+        connection stays borrowed, inside one transaction, until the
+        generator is exhausted or closed.
+        """
+        query = queries.tiebreakQuery(tiebreaks) if tiebreaks else None
+        with self.transaction() as conn:
+            c = conn.cursor(name='export_%s' % tournament)
+            c.itersize = batch_size
+            if query is None:
+                c.execute(queries.STANDINGS, (tournament,))
+            else:
+                c.execute(query, {'t': tournament})
+            for row in c:
+                yield row
+            c.close()
+
+    @timed
+    def reportMatch(self, winner, loser, round=None,
+                    tournament=DEFAULT_TOURNAMENT, result=None):
+        """Records the outcome of a single match between two players.
+
+        Args:
+          winner:  the id number of the player who won
+          loser:  the id number of the player who lost, or None for a bye
+          round:  the round the match was played in, if known
+          tournament:  the id of the tournament both players are in
+          result:  WIN, DRAW or BYE; by default a win, or a bye if there
+            is no loser
+        """
+        row = (winner, loser) if result is None else (winner, loser, result)
+        rows = queries.matchRows([row])
+        (winner, loser, result) = rows[0]
+        with self.cursor() as c:
+            statements.execute(c, 'report_match',
+                               (tournament, round, winner, loser, result))
+            if c.rowcount != 1:
+                raise queries.rejectedMatches(c.rowcount, rows, tournament)
+            if result != BYE:
+                statements.execute(c, 'rate_match',
+                                   (winner, loser, result, K_FACTOR))
+            version = self._bump(c, tournament)
+        self._updateTracked(tournament, lambda model: model.recordMatch(
+            winner, loser, result), version)
+
+    @timed
+    def reportMatches(self, results, round=None,
+                      tournament=DEFAULT_TOURNAMENT):
+        """Records the outcome of a whole round in one transaction.
 
-    #counts the number of names
-    c.execute("SELECT COUNT(name) FROM players")
+        The results are bound into a single multi-row INSERT, which only keeps
+        rows whose players are all registered in the tournament. If any row
+        is dropped, or the batch names a player twice or pits a player
+        against themselves, the whole batch is rejected and nothing is
+        written. The standings triggers count draws and byes as the rows go
+        in, and the players' ratings are updated for the whole batch by one
+        more statement.
 
-    rows = c.fetchone()
-    conn.close()
-    return rows[0]
+        Args:
+          results: an iterable of (winner, loser) tuples, optionally with a
+            third item: WIN, DRAW or BYE, or True for a draw. A bye is
+            (player, None).
+          round: the round these matches were played in, if known.
+          tournament: the id of the tournament all the players are in.
 
-def registerPlayer(pname):
+        Returns:
+          The number of matches recorded.
+        """
+        rows = queries.matchRows(results)
+        if not rows:
+            return 0
+        with self.cursor() as c:
+            c.execute(*queries.reportMatchesQuery(rows, round, tournament))
+            if c.rowcount != len(rows):
+                # raising here rolls the whole batch back
+                raise queries.rejectedMatches(c.rowcount, rows, tournament)
+            c.execute(*queries.rateMatchesQuery(rows, K_FACTOR))
+            version = self._bump(c, tournament)
+        def record(model):
+            for (winner, loser, result) in rows:
+                model.recordMatch(winner, loser, result)
+        self._updateTracked(tournament, record, version)
+        return len(rows)
+
+    @timed
+    def playerRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a list of (id, name, rating) tuples, highest rated first."""
+        with self.cursor() as c:
+            c.execute(queries.RATINGS, (tournament,))
+            return c.fetchall()
+
+    @timed
+    def recalculateRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Rebuilds a tournament's ratings by replaying its whole history.
+
+        The matches are streamed through a server-side cursor and rated in a
+        single pass from each player's initial rating, then the new ratings
+        are copied back and applied by one UPDATE, all in one transaction.
+
+        Returns:
+          The number of players whose ratings were rebuilt.
+        """
+        with self.transaction() as conn:
+            c = conn.cursor()
+            c.execute(queries.INITIAL_RATINGS, (tournament,))
+            players = dict(c.fetchall())
+            history = conn.cursor(name='history_%s' % tournament)
+            history.itersize = 10000
+            history.execute(queries.MATCH_HISTORY, (tournament,))
+            rebuilt = replay(history, players)
+            history.close()
+            c.execute(queries.NEW_RATINGS)
+            buf = StringIO()
+            csv.writer(buf).writerows(rebuilt.items())
+            buf.seek(0)
+            c.copy_expert(queries.COPY_RATINGS, buf)
+            c.execute(queries.APPLY_RATINGS)
+            version = self._bump(c, tournament)
+            c.close()
+        # ratings are not part of the model, but the version still moves
+        self._updateTracked(tournament, lambda model: None, version)
+        return len(rebuilt)
+
+    @timed
+    def auditStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Checks a tournament's standings against its event log.
+
+        Returns:
+          A list of (player, logged, stored) tuples for every player whose
+          standings row differs from the log's replay, where logged and
+          stored are [wins, losses, draws, byes, matches] lists or None.
+          An empty list means the standings agree with the log.
+        """
+        with self.transaction() as conn:
+            logged = replayStandings(conn, tournament)
+            return differences(logged, storedStandings(conn, tournament))
+
+    @timed
+    def rebuildStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Replaces a tournament's standings with a replay of its event log.
+
+        The log is replayed in a single pass and the result copied into the
+        standings table, all in one transaction.
+
+        Returns:
+          The number of standings rows written.
+        """
+        with self.transaction() as conn:
+            logged = replayStandings(conn, tournament)
+            c = conn.cursor()
+            c.execute(queries.DELETE_STANDINGS, (tournament,))
+            buf = StringIO()
+            csv.writer(buf).writerows([pid, tournament] + row
+                                      for (pid, row) in logged.items())
+            buf.seek(0)
+            c.copy_expert(queries.COPY_STANDINGS, buf)
+            statements.execute(c, 'bump_version', (tournament,))
+            c.close()
+        self._untrack(tournament)
+        return len(logged)
+
+    @timed
+    def swissPairings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a list of (id1, name1, id2, name2) pairs for the next round.
+
+        See the module-level swissPairings() for details. Before anyone has
+        played, players are seeded by rating. Until the tournament changes,
+        asking again is answered from the cache.
+        """
+        with self.transaction() as conn:
+            return list(self._snapshot(conn, tournament, ('pairings',),
+                                       lambda: self._pair(conn, tournament)))
+
+    def _pair(self, conn, tournament):
+        # a tracked model is only used if no one else has written since it
+        # was last brought up to date; otherwise a fresh one replaces it
+        version = self._version(conn, tournament)
+        with self._trackLock:
+            entry = self._tracked.get(tournament)
+        if entry is not None and version is not None and entry[1] == version:
+            model = entry[0]
+        else:
+            model = Standings.load(conn, tournament)
+            if entry is not None:
+                with self._trackLock:
+                    self._tracked[tournament] = (model, version)
+        c = conn.cursor()
+        c.execute(queries.RATINGS, (tournament,))
+        rows = c.fetchall()
+        c.close()
+        names = dict((pid, name) for (pid, name, rating) in rows)
+        seeds = None
+        # a tracked model changes under reportMatch() on other threads, so
+        # pair from a copy of everything taken at one moment
+        with self._trackLock:
+            if not any(model.matches):
+                seeds = dict((pid, rating) for (pid, name, rating) in rows)
+            ids, scores = model.rankedColumns(seeds)
+            opponents = dict((pid, set(played))
+                             for (pid, played) in model.opponents.items())
+            byes = set(model.byes)
+        pairs, bye = pairPlayers(ids, scores, opponents, byes)
+        return queries.teams(pairs, bye, names)
+
+    def _snapshot(self, conn, tournament, key, compute):
+        """Returns compute() from the cache, keyed on the tournament's version.
+
+        Every write bumps the version in the transaction that makes it, so a
+        snapshot read at version v already holds every change up to v, from
+        this handle or any other client. A tournament that does not exist
+        yet has no version and is never cached.
+        """
+        version = self._version(conn, tournament)
+        if version is None:
+            return compute()
+        return self.cache.get((tournament,) + key + (version,), compute)
+
+
+def _playerRow(name, rating):
+    """Readies a (name, rating) row from queries.playerRows() for COPY.
+
+    The name comes back as a byte string and a missing rating as
+    INITIAL_RATING.
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return name, INITIAL_RATING if rating is None else rating
+
+
+# The module-level functions below open a fresh connection for every call.
+# They share their implementation with Tournament through an unpooled handle,
+# and are what a pooled Tournament falls back to when no pool is wanted.
+_direct = Tournament(pooled=False)
+
+
+def createTournament(name):
+    """Starts a new tournament and returns its id."""
+    return _direct.createTournament(name)
+
+def archiveTournament(tournament):
+    """Detaches a finished tournament's matches from the live table."""
+    _direct.archiveTournament(tournament)
+
+def deleteMatches(tournament=DEFAULT_TOURNAMENT):
+    """Remove all the match records and the ratings earned from them."""
+    _direct.deleteMatches(tournament)
+
+def deletePlayers(tournament=DEFAULT_TOURNAMENT):
+    """Remove all the player records from one tournament."""
+    _direct.deletePlayers(tournament)
+
+def countPlayers(tournament=DEFAULT_TOURNAMENT):
+    """Returns the number of players currently registered."""
+    return _direct.countPlayers(tournament)
+
+def registerPlayer(pname, tournament=DEFAULT_TOURNAMENT, rating=None):
     """Adds a player to the tournament database.
-  
+
     The database assigns a unique serial id number for the player.  (This
     should be handled by your SQL database schema, not in your Python code.)
-  
+
     Args:
       name: the player's full name (need not be unique).
+      tournament: the id of the tournament the player enters.
+      rating: the player's rating coming in; INITIAL_RATING by default.
+
+    Returns:
+      The new player's id.
     """
-    conn=connect()
-    c=conn.cursor()
-    c.execute("INSERT INTO players (name) VALUES (%s)", (pname,))
-    conn.commit()
-    conn.close()
+    return _direct.registerPlayer(pname, tournament, rating)
 
-def playerStandings():
-    """Returns a list of the players and their win records, sorted by wins.
+def registerPlayers(players, tournament=DEFAULT_TOURNAMENT, conn=None,
+                    header=False):
+    """Adds many players at once with COPY.
+
+    Args:
+      players: an iterable of names, of (name, rating) rows whose rating is
+        optional, or an open CSV file of such rows.
+      tournament: the id of the tournament the players enter.
+      conn: an open connection to run in; the caller commits.
+      header: skip the first row of the input.
+
+    Returns:
+      A list of the new players' ids, in input order.
+    """
+    return _direct.registerPlayers(players, tournament, conn, header)
+
+def playerStandings(tournament=DEFAULT_TOURNAMENT, tiebreaks=()):
+    """Returns a list of the players and their win records, sorted by score.
 
     The first entry in the list should be the player in first place, or a player
     tied for first place if there is currently a tie.
 
+    Args:
+      tournament: the id of the tournament to rank.
+      tiebreaks: names from TIEBREAKS ('buchholz', 'sonneborn_berger',
+        'omw') used, in order, to break ties in score.
+
     Returns:
       A list of tuples, each of which contains (id, name, wins, matches):
         id: the player's unique id (assigned by the database)
         name: the player's full name (as registered)
         wins: the number of matches the player has won
         matches: the number of matches the player has played
+      followed by one column per tiebreak asked for.
     """
-    conn=connect()
-    c=conn.cursor()
-    c.execute("SELECT * FROM playerStandings")
-    rows = c.fetchall()
-    conn.close()
-    return rows
-
-def reportMatch(winner, loser):
+    return _direct.playerStandings(tournament, tiebreaks)
+
+def iterStandings(tournament=DEFAULT_TOURNAMENT, tiebreaks=(),
+                  batch_size=1000):
+    """Yields the rows of playerStandings() without loading them all at once."""
+    return _direct.iterStandings(tournament, tiebreaks, batch_size)
+
+def reportMatch(winner, loser, round=None, tournament=DEFAULT_TOURNAMENT,
+                result=None):
     """Records the outcome of a single match between two players.
 
     Args:
       winner:  the id number of the player who won
-      loser:  the id number of the player who lost
+      loser:  the id number of the player who lost, or None for a bye
+      round:  the round the match was played in, if known
+      tournament:  the id of the tournament both players are in
+      result:  WIN, DRAW or BYE; by default a win, or a bye if there is no
+        loser
     """
-    conn=connect()
-    c=conn.cursor()
+    _direct.reportMatch(winner, loser, round, tournament, result)
 
-    #insert new match into matches table with match id, winner id and loser id
-    c.execute("INSERT INTO matches (winner, loser) VALUES (" + str(winner)+ ", " + str(loser) + ")")
+def reportMatches(results, round=None, tournament=DEFAULT_TOURNAMENT):
+    """Records the outcome of a whole round in one transaction.
 
-    conn.commit()
-    conn.close()
-    print "added"
+    Args:
+      results: an iterable of (winner, loser) or (winner, loser, result)
+        tuples, where result is WIN, DRAW or BYE; a bye is (player, None).
+      round: the round these matches were played in, if known.
+      tournament: the id of the tournament all the players are in.
 
-def swissPairings():
+    Returns:
+      The number of matches recorded.
+    """
+    return _direct.reportMatches(results, round, tournament)
+
+def playerRatings(tournament=DEFAULT_TOURNAMENT):
+    """Returns a list of (id, name, rating) tuples, highest rated first."""
+    return _direct.playerRatings(tournament)
+
+def recalculateRatings(tournament=DEFAULT_TOURNAMENT):
+    """Rebuilds a tournament's ratings from its match history."""
+    return _direct.recalculateRatings(tournament)
+
+def auditStandings(tournament=DEFAULT_TOURNAMENT):
+    """Returns the players whose standings differ from the event log."""
+    return _direct.auditStandings(tournament)
+
+def rebuildStandings(tournament=DEFAULT_TOURNAMENT):
+    """Rebuilds a tournament's standings from its event log."""
+    return _direct.rebuildStandings(tournament)
+
+def swissPairings(tournament=DEFAULT_TOURNAMENT):
     """Returns a list of pairs of players for the next round of a match.
-  
-    Assuming that there are an even number of players registered, each player
-    appears exactly once in the pairings.  Each player is paired with another
-    player with an equal or nearly-equal win record, that is, a player adjacent
-    to him or her in the standings.
-  
+
+    Each player appears exactly once in the pairings.  Each player is paired
+    with another player with an equal or nearly-equal win record, that is, a
+    player adjacent to him or her in the standings, whom they have not played
+    before.  With an odd number of players, the lowest-ranked player sits out
+    and appears last as (id, name, None, None).  In the first round, players
+    are seeded by rating, so the strongest meet each other.
+
+    Args:
+      tournament: the id of the tournament to pair.
+
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2)
         id1: the first player's unique id
@@ -105,20 +795,4 @@ def swissPairings():
         id2: the second player's unique id
         name2: the second player's name
     """
-    #create empty teams list
-    teams = []
-    
-    #create counter called i
-    i = 0
-    
-    #loop through players and append next 2 in list every other loop    
-    allPlayers = playerStandings()
-    for player in allPlayers:
-        if i % 2 == 0:
-            teams.append([allPlayers[i][0], allPlayers[i][1], allPlayers[i + 1][0], allPlayers[i + 1][1]])
-            i += 1
-        else:
-            i += 1
-    return teams
-
-
+    return _direct.swissPairings(tournament)
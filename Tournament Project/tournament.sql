@@ -13,46 +13,195 @@
 DROP DATABASE IF EXISTS tournament;
 CREATE DATABASE tournament;
 
--- create new instance of players table
+-- create new instance of tournaments table. every player and match belongs
+-- to one tournament, so many events can share the database. version goes up
+-- with every write to a tournament's players or matches, so cached standings
+-- and pairings can tell when they are out of date
+DROP TABLE IF EXISTS tournaments;
+CREATE TABLE tournaments (id serial primary key,
+                          name text,
+                          archived boolean NOT NULL DEFAULT false,
+                          version int NOT NULL DEFAULT 0);
+
+-- create new instance of players table. rating is the player's Elo rating,
+-- updated as each batch of matches is reported (see ratings.py), starting
+-- from initial_rating, which registration may set
 DROP TABLE IF EXISTS players;
-CREATE TABLE players (id serial primary key, name text);
+CREATE TABLE players (id serial primary key,
+                      tournament int NOT NULL DEFAULT 1 references tournaments (id),
+                      name text,
+                      rating float8 NOT NULL DEFAULT 1500,
+                      initial_rating float8 NOT NULL DEFAULT 1500,
+                      UNIQUE (tournament, id));
+CREATE INDEX players_tournament ON players (tournament);
+
+-- how a match ended. a draw still names both players as winner and loser;
+-- a bye is a win for the player sitting out, with no loser
+DROP TYPE IF EXISTS match_result;
+CREATE TYPE match_result AS ENUM ('win', 'draw', 'bye');
 
--- create new instance of matches table
+-- create new instance of matches table, split into one partition per
+-- tournament so a big event's history never slows down another's queries.
+-- the player keys include the tournament, so the check run when a player is
+-- deleted looks in that tournament's partition alone, through the indexes
+-- below; a bye's null loser is not checked
 DROP TABLE IF EXISTS matches;
-CREATE TABLE matches (id serial, winner int references players (id), loser int references players (id));
+CREATE TABLE matches (id serial,
+                      tournament int NOT NULL DEFAULT 1,
+                      round int,
+                      winner int,
+                      loser int,
+                      result match_result NOT NULL DEFAULT 'win',
+                      CHECK ((result = 'bye') = (loser IS NULL)),
+                      primary key (tournament, id),
+                      foreign key (tournament, winner) references players (tournament, id),
+                      foreign key (tournament, loser) references players (tournament, id))
+    PARTITION BY LIST (tournament);
+
+-- index both sides of a match so looking up a player's games is an index
+-- scan; each index carries the other player so it can answer on its own
+CREATE INDEX matches_winner ON matches (tournament, winner, loser);
+CREATE INDEX matches_loser ON matches (tournament, loser, winner);
+
+-- create new instance of standings table. one row per player, kept current
+-- by the triggers below so reading standings never has to scan matches.
+-- byes are counted in wins and matches as well as on their own
+DROP TABLE IF EXISTS standings;
+CREATE TABLE standings (player int primary key references players (id) ON DELETE CASCADE,
+                        tournament int NOT NULL,
+                        wins int NOT NULL DEFAULT 0,
+                        losses int NOT NULL DEFAULT 0,
+                        draws int NOT NULL DEFAULT 0,
+                        byes int NOT NULL DEFAULT 0,
+                        matches int NOT NULL DEFAULT 0);
+-- ranked by score: a win is worth two draws
+CREATE INDEX standings_rank ON standings (tournament, (2 * wins + draws) DESC, player);
+
+-- give every new player an empty standings row
+CREATE FUNCTION add_standing() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO standings (player, tournament) VALUES (NEW.id, NEW.tournament);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER players_standing AFTER INSERT ON players
+    FOR EACH ROW EXECUTE PROCEDURE add_standing();
+
+-- add or take away one match from both players' standings rows. a bye has
+-- no loser, so the second update finds no row
+CREATE FUNCTION count_match(winner int, loser int, result match_result, sign int) RETURNS void AS $$
+BEGIN
+    UPDATE standings
+       SET wins = wins + sign * (result <> 'draw')::int,
+           draws = draws + sign * (result = 'draw')::int,
+           byes = byes + sign * (result = 'bye')::int,
+           matches = matches + sign
+     WHERE player = winner;
+    UPDATE standings
+       SET losses = losses + sign * (result <> 'draw')::int,
+           draws = draws + sign * (result = 'draw')::int,
+           matches = matches + sign
+     WHERE player = loser;
+END;
+$$ LANGUAGE plpgsql;
+
+-- keep standings in step with every insert, correction or delete on matches
+CREATE FUNCTION update_standings() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM count_match(OLD.winner, OLD.loser, OLD.result, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM count_match(NEW.winner, NEW.loser, NEW.result, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
 
--- create view to join players with matches
-CREATE VIEW JoinAll AS SELECT players.id AS Player, matches.id AS Match, matches.winner AS Winner, matches.loser AS Loser FROM players, matches WHERE players.id = winner or players.id = loser;
+CREATE TRIGGER matches_standings AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE update_standings();
 
--- create view to display win count for each player
-CREATE VIEW Winners AS SELECT player, name, count(winner) AS wins FROM JoinAll WHERE player = winner GROUP BY player;
+-- create new instance of events table: an append-only log of every
+-- registration, withdrawal, result and correction, written by the triggers
+-- below in the same transaction as the change itself. a correction logs a
+-- 'void' of the old result followed by a 'correction' with the new one, so
+-- the log alone is enough to rebuild standings (see eventlog.py). it has no
+-- foreign keys, so it outlives the rows it describes
+DROP TABLE IF EXISTS events;
+CREATE TABLE events (id bigserial,
+                     tournament int NOT NULL,
+                     logged_at timestamptz NOT NULL DEFAULT now(),
+                     kind text NOT NULL CHECK (kind IN ('register', 'withdraw', 'result',
+                                                        'void', 'correction')),
+                     player int,
+                     name text,
+                     match int,
+                     round int,
+                     winner int,
+                     loser int,
+                     result match_result,
+                     primary key (tournament, id));
 
--- create view to display loss count for each player
-CREATE VIEW Losers AS SELECT player, count(loser) AS losses FROM JoinAll WHERE player = loser GROUP BY player;
+CREATE FUNCTION log_player() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO events (tournament, kind, player, name)
+        VALUES (NEW.tournament, 'register', NEW.id, NEW.name);
+    ELSE
+        INSERT INTO events (tournament, kind, player, name)
+        VALUES (OLD.tournament, 'withdraw', OLD.id, OLD.name);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
 
--- create view to show match count for each player
-CREATE VIEW SumMatches AS SELECT player, count(*) AS matches FROM JoinAll GROUP BY player;
+CREATE TRIGGER players_log AFTER INSERT OR DELETE ON players
+    FOR EACH ROW EXECUTE PROCEDURE log_player();
 
--- create view to join win and loss count in one table
-CREATE VIEW Standings AS SELECT winners.player,
-           winners.wins,
-           losers.losses 
-      FROM winners
- LEFT JOIN losers ON losers.player = winners.player
-UNION
-    SELECT losers.player,
-           winners.wins,
-           losers.losses
-      FROM winners
-RIGHT JOIN losers ON losers.player = winners.player ORDER BY wins DESC nulls last;
+CREATE FUNCTION log_match() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO events (tournament, kind, match, round, winner, loser, result)
+        VALUES (OLD.tournament, 'void', OLD.id, OLD.round, OLD.winner, OLD.loser, OLD.result);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO events (tournament, kind, match, round, winner, loser, result)
+        VALUES (NEW.tournament, CASE TG_OP WHEN 'INSERT' THEN 'result' ELSE 'correction' END,
+                NEW.id, NEW.round, NEW.winner, NEW.loser, NEW.result);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
 
--- create view to add matches count to standings
-CREATE VIEW StandingsWithMatches AS select players.id, players.name, Standings.wins, summatches.matches from Standings, summatches, players where Standings.player = summatches.player and players.id = summatches.player ORDER BY wins DESC nulls last;
+CREATE TRIGGER matches_log AFTER INSERT OR UPDATE OR DELETE ON matches
+    FOR EACH ROW EXECUTE PROCEDURE log_match();
 
--- create final view to see player & id if no matches, and display wins & matches as 0 if null
-CREATE VIEW PlayerStandings AS SELECT players.id, players.name, coalesce(StandingsWithMatches.wins, 0) as wins, coalesce(StandingsWithMatches.matches, 0) as matches
-      FROM players
- LEFT JOIN StandingsWithMatches ON StandingsWithMatches.id = players.id;
+-- create view to show id, name, wins and matches for each player, best first
+CREATE VIEW PlayerStandings AS SELECT players.id, players.name, standings.wins, standings.matches, standings.tournament, standings.draws
+      FROM standings
+      JOIN players ON players.id = standings.player
+  ORDER BY standings.tournament, 2 * standings.wins + standings.draws DESC, standings.player;
 
+-- start a new tournament along with the matches partition that holds its games
+CREATE FUNCTION create_tournament(tname text) RETURNS int AS $$
+DECLARE
+    tid int;
+BEGIN
+    INSERT INTO tournaments (name) VALUES (tname) RETURNING id INTO tid;
+    EXECUTE format('CREATE TABLE matches_%s PARTITION OF matches FOR VALUES IN (%s)', tid, tid);
+    RETURN tid;
+END;
+$$ LANGUAGE plpgsql;
 
+-- detach a finished tournament's matches partition. its matches_<id> table
+-- stays behind as a plain table that can be dumped and dropped at leisure
+CREATE FUNCTION archive_tournament(tid int) RETURNS void AS $$
+BEGIN
+    EXECUTE format('ALTER TABLE matches DETACH PARTITION matches_%s', tid);
+    UPDATE tournaments SET archived = true WHERE id = tid;
+END;
+$$ LANGUAGE plpgsql;
 
+-- tournament 1 is the default for callers that never name a tournament
+SELECT create_tournament('default');
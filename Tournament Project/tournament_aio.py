@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# tournament_aio.py -- asyncio client for the Swiss-system tournament
+#
+# The day-to-day operations of tournament.Tournament, as coroutines over an
+# aiopg connection pool: creating and archiving tournaments, registering,
+# counting and deleting players, reporting and deleting matches, standings,
+# ratings and pairings. It needs Python 3.7+ and aiopg; the SQL comes from
+# queries.py and pairing from pairing.py, so both clients behave the same.
+#
+# Asynchronous psycopg2 connections cannot COPY or hold server-side cursors,
+# so the calls built on them stay with the blocking client: iterStandings(),
+# recalculateRatings(), auditStandings(), rebuildStandings(), loadEvents()
+# and trackStandings().
+#
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiopg
+
+import queries
+from pairing import pairPlayers
+from queries import DEFAULT_TOURNAMENT
+from ratings import INITIAL_RATING, K_FACTOR
+from standings import LOAD_SQL, Standings
+
+
+DSN = "dbname=tournament"
+
+
+class AsyncTournament(object):
+    """An asyncio handle on the tournament database.
+
+    Create one with ``await AsyncTournament.connect()`` and ``await
+    t.close()`` it when done, or use it as ``async with``.
+
+    Args:
+      pool: an aiopg pool.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    @classmethod
+    async def connect(cls, dsn=DSN, minsize=1, maxsize=10, **connectArgs):
+        """Opens a pool of minsize to maxsize connections."""
+        pool = await aiopg.create_pool(dsn, minsize=minsize, maxsize=maxsize,
+                                       **connectArgs)
+        return cls(pool)
+
+    async def close(self):
+        self._pool.close()
+        await self._pool.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @asynccontextmanager
+    async def cursor(self):
+        """Borrows a cursor inside its own transaction.
+
+        aiopg connections run in autocommit mode, so the transaction is
+        opened and closed explicitly.
+        """
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as c:
+                await c.execute("BEGIN")
+                try:
+                    yield c
+                except BaseException:
+                    await c.execute("ROLLBACK")
+                    raise
+                await c.execute("COMMIT")
+
+    async def createTournament(self, name):
+        """Starts a new tournament and returns its id."""
+        async with self.cursor() as c:
+            await c.execute(queries.CREATE_TOURNAMENT, (name,))
+            return (await c.fetchone())[0]
+
+    async def archiveTournament(self, tournament):
+        """Detaches a finished tournament's matches from the live table."""
+        async with self.cursor() as c:
+            await c.execute(queries.ARCHIVE_TOURNAMENT, (tournament,))
+
+    async def deleteMatches(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the match records and the ratings earned from them."""
+        async with self.cursor() as c:
+            await c.execute(queries.DELETE_MATCHES, (tournament,))
+            await c.execute(queries.RESET_RATINGS, (tournament,))
+            await c.execute(queries.BUMP_VERSION, (tournament,))
+
+    async def deletePlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Remove all the player records from one tournament."""
+        async with self.cursor() as c:
+            await c.execute(queries.DELETE_PLAYERS, (tournament,))
+            await c.execute(queries.BUMP_VERSION, (tournament,))
+
+    async def countPlayers(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns the number of players currently registered."""
+        async with self.cursor() as c:
+            await c.execute(queries.COUNT_PLAYERS, (tournament,))
+            return (await c.fetchone())[0]
+
+    async def registerPlayer(self, pname, tournament=DEFAULT_TOURNAMENT,
+                             rating=None):
+        """Adds a player to a tournament and returns the new id.
+
+        rating is the player's rating coming in; INITIAL_RATING by default.
+        """
+        if rating is None:
+            rating = INITIAL_RATING
+        async with self.cursor() as c:
+            await c.execute(queries.REGISTER_PLAYER,
+                            (tournament, pname, rating, rating))
+            pid = (await c.fetchone())[0]
+            await c.execute(queries.BUMP_VERSION, (tournament,))
+            return pid
+
+    async def registerPlayers(self, players, tournament=DEFAULT_TOURNAMENT,
+                              header=False):
+        """Adds many players in one statement; returns ids in input order.
+
+        players are names, (name, rating) rows or an open CSV file of them,
+        as for the blocking client; header skips the first row. Asynchronous
+        connections cannot COPY, so this reserves the ids and sends a single
+        multi-row INSERT instead.
+        """
+        rows = list(queries.playerRows(players, header))
+        if not rows:
+            return []
+        async with self.cursor() as c:
+            await c.execute(queries.PLAYERS_SEQUENCE)
+            sequence = (await c.fetchone())[0]
+            await c.execute(queries.RESERVE_IDS, (sequence, len(rows)))
+            ids = sorted(row[0] for row in await c.fetchall())
+            params = []
+            for pid, (name, rating) in zip(ids, rows):
+                if rating is None:
+                    rating = INITIAL_RATING
+                params.extend((pid, tournament, name, rating, rating))
+            await c.execute("INSERT INTO players (id, tournament, name, rating, "
+                            "initial_rating) VALUES "
+                            + ", ".join(["(%s, %s, %s, %s, %s)"] * len(ids)),
+                            params)
+            await c.execute(queries.BUMP_VERSION, (tournament,))
+        return ids
+
+    async def playerStandings(self, tournament=DEFAULT_TOURNAMENT,
+                              tiebreaks=()):
+        """Returns (id, name, wins, matches, ...) rows, best first."""
+        query = queries.tiebreakQuery(tiebreaks) if tiebreaks else None
+        async with self.cursor() as c:
+            if query is None:
+                await c.execute(queries.STANDINGS, (tournament,))
+            else:
+                await c.execute(query, {'t': tournament})
+            return await c.fetchall()
+
+    async def reportMatch(self, winner, loser, round=None,
+                          tournament=DEFAULT_TOURNAMENT, result=None):
+        """Records the outcome of a single match; see Tournament.reportMatch."""
+        row = (winner, loser) if result is None else (winner, loser, result)
+        await self.reportMatches([row], round, tournament)
+
+    async def reportMatches(self, results, round=None,
+                            tournament=DEFAULT_TOURNAMENT):
+        """Records a whole round in one statement; see Tournament.reportMatches."""
+        rows = queries.matchRows(results)
+        if not rows:
+            return 0
+        async with self.cursor() as c:
+            await c.execute(*queries.reportMatchesQuery(rows, round, tournament))
+            if c.rowcount != len(rows):
+                raise queries.rejectedMatches(c.rowcount, rows, tournament)
+            await c.execute(*queries.rateMatchesQuery(rows, K_FACTOR))
+            await c.execute(queries.BUMP_VERSION, (tournament,))
+        return len(rows)
+
+    async def playerRatings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a list of (id, name, rating) tuples, highest rated first."""
+        async with self.cursor() as c:
+            await c.execute(queries.RATINGS, (tournament,))
+            return await c.fetchall()
+
+    async def loadStandings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns a Standings model of one tournament."""
+        async with self.cursor() as c:
+            await c.execute(LOAD_SQL, {'t': tournament})
+            return Standings.fromRows(await c.fetchall(), tournament)
+
+    async def swissPairings(self, tournament=DEFAULT_TOURNAMENT):
+        """Returns (id1, name1, id2, name2) pairs for the next round.
+
+        The pairing itself is CPU work, so it runs in the default executor
+        rather than holding up the event loop for a big field. Before anyone
+        has played, players are seeded by rating.
+        """
+        async with self.cursor() as c:
+            await c.execute(LOAD_SQL, {'t': tournament})
+            rows = await c.fetchall()
+            await c.execute(queries.RATINGS, (tournament,))
+            players = await c.fetchall()
+        model = Standings.fromRows(rows, tournament)
+        names = dict((pid, name) for (pid, name, rating) in players)
+        seeds = None
+        if not any(model.matches):
+            seeds = dict((pid, rating) for (pid, name, rating) in players)
+        ids, scores = model.rankedColumns(seeds)
+        loop = asyncio.get_event_loop()
+        pairs, bye = await loop.run_in_executor(
+            None, pairPlayers, ids, scores, model.opponents, model.byes)
+        return queries.teams(pairs, bye, names)
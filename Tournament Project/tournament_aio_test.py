@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Test cases for tournament_aio.py
+#
+# Runs against the same database as tournament_test.py, under Python 3.7+.
+# Without aiopg installed there is nothing to test, so it says so and stops.
+
+import asyncio
+import io
+import sys
+
+try:
+    import aiopg
+except ImportError:
+    aiopg = None
+
+from queries import DRAW
+
+
+async def testRegister(t):
+    await t.deleteMatches()
+    await t.deletePlayers()
+    if await t.countPlayers() != 0:
+        raise ValueError("After deleting, countPlayers should return zero.")
+    top = await t.registerPlayer("Chandra Nalaar", rating=1600)
+    ids = await t.registerPlayers(
+        io.StringIO("name,rating\nMarkov Chaney,1400\nJoe Malik,\n"),
+        header=True)
+    if await t.countPlayers() != 3:
+        raise ValueError("Every registration should be counted.")
+    rated = [(row[0], row[2]) for row in await t.playerRatings()]
+    if rated != [(top, 1600), (ids[1], 1500), (ids[0], 1400)]:
+        raise ValueError("Players should start on the rating they register "
+                         "with, or 1500.")
+    print("1. Players register one at a time or from a CSV file.")
+
+
+async def testReportAndStandings(t):
+    await t.deleteMatches()
+    await t.deletePlayers()
+    [a, b, c, d] = await t.registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+    await t.reportMatches([(a, b), (c, d, DRAW)], round=1)
+    standings = await t.playerStandings()
+    if [row[0] for row in standings] != [a, c, d, b]:
+        raise ValueError("Standings should rank a win, then draws, then a "
+                         "loss.")
+    if [tuple(row[2:4]) for row in standings] != [(1, 1), (0, 1), (0, 1),
+                                                  (0, 1)]:
+        raise ValueError("Each player should have one match recorded.")
+    print("2. Reported matches show up in the standings, best first.")
+
+
+async def testPairings(t):
+    await t.deleteMatches()
+    await t.deletePlayers()
+    [a, b, c, d] = await t.registerPlayers([("Ace", 1400), ("Bea", 1600),
+                                            ("Cid", 1500), ("Dot", 1300)])
+    pairs = [(row[0], row[2]) for row in await t.swissPairings()]
+    if pairs != [(b, c), (a, d)]:
+        raise ValueError("The first round should be seeded by rating.")
+    await t.reportMatches(pairs, round=1)
+    pairs = [(row[0], row[2]) for row in await t.swissPairings()]
+    played = set(frozenset(pair) for pair in [(b, c), (a, d)])
+    if sorted(pid for pair in pairs for pid in pair) != sorted([a, b, c, d]):
+        raise ValueError("Every player should be paired exactly once.")
+    if any(frozenset(pair) in played for pair in pairs):
+        raise ValueError("Nobody should meet the same opponent twice.")
+    if set(pairs[0]) != set([b, a]):
+        raise ValueError("The winners should meet each other.")
+    print("3. Pairings seed by rating, then follow the standings.")
+
+
+async def runTests():
+    from tournament_aio import AsyncTournament
+    async with await AsyncTournament.connect() as t:
+        await testRegister(t)
+        await testReportAndStandings(t)
+        await testPairings(t)
+
+
+if __name__ == '__main__':
+    if aiopg is None:
+        print("aiopg is not installed; skipping the asyncio client tests.")
+        sys.exit(0)
+    asyncio.run(runTests())
+    print("Success!  All tests pass!")
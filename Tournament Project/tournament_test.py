@@ -2,6 +2,11 @@
 #
 # Test cases for tournament.py
 
+from StringIO import StringIO
+
+from export import exportStandings
+from instrument import Aggregator, Hook, addHook, disable, enable, removeHook
+from statements import ADHOC, PREPARED
 from tournament import *
 
 def testDeleteMatches():
@@ -125,6 +130,450 @@ def testPairings():
     print "8. After one match, players with one win are paired."
 
 
+def testPooledHandle():
+    deleteMatches()
+    deletePlayers()
+    with Tournament(minconn=1, maxconn=2, healthcheck=True) as t:
+        for name in ("Rarity", "Spike", "Big Mac"):
+            t.registerPlayer(name)
+        conn = t._getconn()
+        t._putconn(conn)
+        again = t._getconn()
+        t._putconn(again)
+        if again is not conn:
+            raise ValueError("A pooled handle should hand back the same "
+                             "idle connection.")
+        if t.countPlayers() != 3:
+            raise ValueError(
+                "Players registered through a pooled handle should count.")
+    if countPlayers() != 3:
+        raise ValueError("The module-level functions should see the same data "
+                         "as a pooled handle.")
+    print "9. A pooled Tournament handle reuses its connections."
+
+
+def testReportMatchesBatch():
+    deleteMatches()
+    deletePlayers()
+    for name in ("Ann", "Ben", "Cal", "Dee"):
+        registerPlayer(name)
+    [id1, id2, id3, id4] = [row[0] for row in playerStandings()]
+    try:
+        reportMatches([(id1, id2), (id2, id3)])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A player with two results in one batch should be "
+                         "rejected.")
+    try:
+        reportMatches([(id1, id2), (id3, -1)])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Results for unregistered players should be rejected.")
+    if any(m != 0 for (i, n, w, m) in playerStandings()):
+        raise ValueError("A rejected batch should not record any matches.")
+    if reportMatches([(id1, id2), (id3, id4, True)]) != 2:
+        raise ValueError("reportMatches should return the number recorded.")
+    for (i, n, w, m) in playerStandings():
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+        if w != (1 if i == id1 else 0):
+            raise ValueError("Only the decisive winner should gain a win.")
+    print "10. A round of results can be reported in one batch."
+
+
+def testRegisterPlayersBulk():
+    deleteMatches()
+    deletePlayers()
+    names = ["Entrant %d" % i for i in range(2500)]
+    names[7] = 'Quote "Q" Comma, Jr.'
+    ids = registerPlayers(iter(names))
+    if len(ids) != len(names) or ids != sorted(ids):
+        raise ValueError("registerPlayers should return one id per name, in "
+                         "input order.")
+    byId = dict((i, n) for (i, n, w, m) in playerStandings())
+    if [byId[i] for i in ids] != names:
+        raise ValueError("Each returned id should belong to its input name.")
+    csvfile = StringIO("name\nFirst Csv\nSecond Csv\n")
+    if len(registerPlayers(csvfile, header=True)) != 2:
+        raise ValueError("registerPlayers should read rows from a CSV file.")
+    conn = connect()
+    registerPlayers(["Uncommitted"], conn=conn)
+    conn.rollback()
+    conn.close()
+    if countPlayers() != len(names) + 2:
+        raise ValueError("registerPlayers should run inside a caller's "
+                         "transaction when given a connection.")
+    print "11. Players can be registered in bulk."
+
+
+def _planNodes(plan):
+    """Yields every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get('Plans', []):
+        for node in _planNodes(child):
+            yield node
+
+
+def testIndexedHistory():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers("Player %d" % i for i in range(1000))
+    for rnd in range(200):
+        # rotate the field so every round is a fresh set of 500 boards
+        shift = rnd % 999 + 1
+        order = ids[:1] + ids[1:][shift - 1:] + ids[1:][:shift - 1]
+        reportMatches(zip(order[0::2], order[1::2]), round=rnd + 1)
+    conn = connect()
+    c = conn.cursor()
+    c.execute("ANALYZE matches")
+    c.execute("ANALYZE standings")
+    c.execute("EXPLAIN (FORMAT JSON) SELECT winner, loser FROM matches "
+              "WHERE tournament = 1 AND (winner = %s OR loser = %s)",
+              (ids[0], ids[0]))
+    nodes = list(_planNodes(c.fetchone()[0][0]['Plan']))
+    if any(n['Node Type'] == 'Seq Scan' for n in nodes):
+        raise ValueError("A player's match history should not need a "
+                         "sequential scan of 100k matches.")
+    if not any('Index' in n['Node Type'] for n in nodes):
+        raise ValueError("A player's match history should use the matches "
+                         "indexes.")
+    c.execute("EXPLAIN (FORMAT JSON) SELECT * FROM playerStandings")
+    nodes = list(_planNodes(c.fetchone()[0][0]['Plan']))
+    if any(n.get('Relation Name') == 'matches' for n in nodes):
+        raise ValueError("Reading standings should not touch matches.")
+    conn.close()
+    print "12. Match history lookups use the matches indexes at 100k matches."
+
+
+def testSeparateTournaments():
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("Home Player")
+    other = createTournament("Side Event")
+    [id1, id2] = registerPlayers(["Side One", "Side Two"], other)
+    if countPlayers() != 1 or countPlayers(other) != 2:
+        raise ValueError("Each tournament should count only its own players.")
+    try:
+        reportMatch(id1, id2)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Matches should only be reported within the "
+                         "players' own tournament.")
+    reportMatch(id1, id2, tournament=other)
+    if [row[0] for row in playerStandings(other)] != [id1, id2]:
+        raise ValueError("Standings should be kept per tournament.")
+    if any(m != 0 for (i, n, w, m) in playerStandings()):
+        raise ValueError("Another tournament's matches should not show up.")
+    deleteMatches()
+    if playerStandings(other)[0][2] != 1:
+        raise ValueError("Deleting matches should only affect one tournament.")
+    archiveTournament(other)
+    conn = connect()
+    c = conn.cursor()
+    c.execute("SELECT count(*) FROM matches_%s" % other)
+    if c.fetchone()[0] != 1:
+        raise ValueError("An archived tournament should keep its matches.")
+    c.execute("DROP TABLE matches_%s" % other)
+    c.execute("DELETE FROM players WHERE tournament = %s", (other,))
+    conn.commit()
+    conn.close()
+    print "13. Tournaments keep their players and matches apart."
+
+
+def testTrackedStandings():
+    deleteMatches()
+    deletePlayers()
+    with Tournament(maxconn=2) as t:
+        model = t.trackStandings()
+        ids = [t.registerPlayer(name) for name in ("Al", "Bo", "Cy", "Di")]
+        t.reportMatches([(ids[0], ids[1]), (ids[2], ids[3], True)], round=1)
+        t.reportMatch(ids[0], ids[2], round=2)
+        # a rematch, whose opponent is already counted
+        t.reportMatch(ids[1], ids[0], round=3)
+        if t.trackStandings() is not model:
+            raise ValueError("A tracked model should be reused, not reloaded.")
+        fresh = t.loadStandings()
+        for pid in ids:
+            i, j = model.index[pid], fresh.index[pid]
+            if ((model.wins[i], model.draws[i], model.matches[i],
+                 model.oppScores[i], model.opponents[pid]) !=
+                (fresh.wins[j], fresh.draws[j], fresh.matches[j],
+                 fresh.oppScores[j], fresh.opponents[pid])):
+                raise ValueError("A tracked model should match one loaded "
+                                 "fresh from the database.")
+        if model.rankedColumns()[0][0] != ids[0]:
+            raise ValueError("The player with the most wins should rank "
+                             "first.")
+    print "14. Tracked standings stay in step with reported results."
+
+
+def testTiebreaks():
+    deleteMatches()
+    deletePlayers()
+    [a, b, c, d] = registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+    reportMatches([(a, b), (c, d)], round=1)
+    reportMatches([(a, c), (b, d, True)], round=2)
+    standings = playerStandings(tiebreaks=['buchholz', 'sonneborn_berger'])
+    if [row[0] for row in standings] != [a, c, b, d]:
+        raise ValueError("Ties in wins should be broken by Buchholz score.")
+    expected = {a: (1.5, 1.5), b: (2.5, 0.25), c: (2.5, 0.5), d: (1.5, 0.25)}
+    for row in standings:
+        if (float(row[4]), float(row[5])) != expected[row[0]]:
+            raise ValueError("Tiebreak scores should be worked out from "
+                             "opponents' scores.")
+    try:
+        playerStandings(tiebreaks=['coin toss'])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Unknown tiebreaks should be rejected.")
+    print "15. Standings can be ordered by tiebreak scores."
+
+
+def testSnapshotCache():
+    deleteMatches()
+    deletePlayers()
+    with Tournament(cacheSize=4) as t:
+        [a, b] = t.registerPlayers(["Ace", "Bea"])
+        standings = t.playerStandings()
+        pairings = t.swissPairings()
+        hits = t.cache.hits
+        if t.playerStandings() != standings or t.swissPairings() != pairings:
+            raise ValueError("Cached snapshots should match the originals.")
+        if t.cache.hits != hits + 2:
+            raise ValueError("Asking again without any writes should hit the "
+                             "cache.")
+        t.reportMatch(a, b)
+        if t.playerStandings()[0][2] != 1:
+            raise ValueError("Reporting a match should invalidate cached "
+                             "standings.")
+        registerPlayer("Cid")
+        if len(t.playerStandings()) != 3:
+            raise ValueError("Writes from another client should invalidate "
+                             "cached standings too.")
+        if len(t.cache) > 4:
+            raise ValueError("The cache should hold at most cacheSize entries.")
+    print "16. Standings and pairings are cached until the tournament changes."
+
+
+def testRatings():
+    deleteMatches()
+    deletePlayers()
+    [a, b, c] = registerPlayers([("Ace", 1600), ("Bea", "1400"), ("Cid",)])
+    d = registerPlayer("Dot", rating=1450)
+    seeded = dict((row[0], row[2]) for row in playerRatings())
+    if seeded != {a: 1600, b: 1400, c: 1500, d: 1450}:
+        raise ValueError("Players should start on the rating they register "
+                         "with, or 1500.")
+    if [(row[0], row[2]) for row in swissPairings()] != [(a, c), (d, b)]:
+        raise ValueError("The first round should be seeded by rating.")
+    reportMatches([(b, a), (c, d)], round=1)
+    rated = dict((row[0], row[2]) for row in playerRatings())
+    if (rated[b] - 1400 <= rated[c] - 1500 or
+            abs(rated[a] + rated[b] - 3000) > 1e-9):
+        raise ValueError("An upset should move the players further than a "
+                         "favourite's win, and take what it gives.")
+    if recalculateRatings() != 4:
+        raise ValueError("Every player in the tournament should be rerated.")
+    for (pid, name, rating) in playerRatings():
+        if abs(rating - rated[pid]) > 1e-9:
+            raise ValueError("Replaying the history should give the same "
+                             "ratings as reporting it.")
+    deleteMatches()
+    if dict((row[0], row[2]) for row in playerRatings()) != seeded:
+        raise ValueError("Deleting the matches should restore the ratings "
+                         "players registered with.")
+    print "17. Ratings start where players register, follow their matches " \
+          "and seed the first round."
+
+
+def testStreamingExport():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers("Player %d" % i for i in range(2500))
+    reportMatches(zip(ids[::2], ids[1::2]), round=1)
+    streamed = iterStandings(tiebreaks=['buchholz'], batch_size=100)
+    if list(streamed) != playerStandings(tiebreaks=['buchholz']):
+        raise ValueError("iterStandings() should yield the same rows as "
+                         "playerStandings().")
+    out = StringIO()
+    with Tournament(pooled=False) as t:
+        written = exportStandings(t, out, format='jsonl', batch_size=100)
+    lines = out.getvalue().splitlines()
+    if written != 2500 or len(lines) != 2500 or '"wins": 1' not in lines[0]:
+        raise ValueError("Exporting should write one line per player, best "
+                         "first.")
+    print "18. Standings stream out through a server-side cursor."
+
+
+class _Statements(Hook):
+    def __init__(self):
+        self.seen = []
+
+    def statement(self, query, rowcount, seconds):
+        self.seen.append((query, rowcount))
+
+
+def testInstrumentation():
+    deleteMatches()
+    deletePlayers()
+    [a, b] = registerPlayers(["Ace", "Bea"])
+    stats = Aggregator()
+    statements = _Statements()
+    addHook(stats)
+    addHook(statements)
+    enable()
+    try:
+        reportMatch(a, b)
+        countPlayers()
+    finally:
+        disable()
+        removeHook(stats)
+        removeHook(statements)
+    countPlayers()
+    report = stats.report()
+    if sorted(report) != ['countPlayers', 'reportMatch']:
+        raise ValueError("Only the outermost public calls should be timed, "
+                         "and only while enabled.")
+    if report['countPlayers']['calls'] != 1:
+        raise ValueError("Calls made while disabled should not be counted.")
+    if report['reportMatch']['queries_per_call'] != len(statements.seen) - 1:
+        raise ValueError("Every statement a call sends should be counted.")
+    if (ADHOC['count_players'], 1) not in statements.seen:
+        raise ValueError("Hooks should see each statement and its rows.")
+    print "19. Calls and statements can be timed through hooks."
+
+
+def testByesAndDraws():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers(["Ace", "Bea", "Cid", "Dot", "Eve"])
+    pairings = swissPairings()
+    [bye] = [row[0] for row in pairings if row[2] is None]
+    results = [(row[0], row[2], DRAW) for row in pairings if row[2] is not None]
+    results.append((bye, None))
+    reportMatches(results, round=1)
+    standings = dict((row[0], row[2:4]) for row in playerStandings())
+    if standings[bye] != (1, 1):
+        raise ValueError("A bye should count as a win.")
+    if any(standings[pid] != (0, 1) for pid in ids if pid != bye):
+        raise ValueError("A draw should count as played, not won.")
+    if bye in [row[0] for row in swissPairings() if row[2] is None]:
+        raise ValueError("Nobody should be given a second bye.")
+    try:
+        reportMatch(ids[0], ids[1], result=BYE)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A bye should not name an opponent.")
+    deleteMatches()
+    deletePlayers()
+    [a, b, c, d] = registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+    reportMatches([(a, b), (c, d, DRAW)], round=1)
+    for tiebreaks in ((), ('buchholz',)):
+        ranked = [row[0] for row in playerStandings(tiebreaks=tiebreaks)]
+        if ranked != [a, c, d, b]:
+            raise ValueError("A draw should rank above a loss.")
+    print "20. Byes and draws are recorded as they are reported."
+
+
+def testEventLog():
+    deleteMatches()
+    deletePlayers()
+    [a, b, c, d] = registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+    reportMatches([(a, b), (c, d)], round=1)
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("UPDATE matches SET result = 'draw' WHERE winner = %s", (c,))
+    conn.commit()
+    if auditStandings():
+        raise ValueError("Standings kept by the triggers should agree with "
+                         "the event log, corrections included.")
+    before = playerStandings()
+    cur.execute("UPDATE standings SET wins = 5 WHERE player = %s", (b,))
+    conn.commit()
+    conn.close()
+    if [row[0] for row in auditStandings()] != [b]:
+        raise ValueError("The audit should find a corrupted standings row.")
+    if rebuildStandings() != 4:
+        raise ValueError("Every registered player should be rebuilt.")
+    if auditStandings() or playerStandings() != before:
+        raise ValueError("Rebuilding should restore the standings from the "
+                         "log.")
+    print "21. Standings can be audited and rebuilt from the event log."
+
+
+def testPreparedStatements():
+    deleteMatches()
+    deletePlayers()
+    with Tournament(maxconn=1, cacheSize=0) as t:
+        a = t.registerPlayer("Ace")
+        b = t.registerPlayer("Bea")
+        t.reportMatch(a, b, round=1)
+        t.reportMatch(b, a, round=2, result=DRAW)
+        standings = t.playerStandings()
+        count = t.countPlayers()
+        with t.transaction() as conn:
+            if not conn.prepared:
+                raise ValueError("Pooled connections should prepare the hot "
+                                 "statements.")
+            c = conn.cursor()
+            c.execute("SELECT name FROM pg_prepared_statements")
+            names = set(row[0] for row in c.fetchall())
+            c.close()
+        if names != conn.prepared or not names <= set(PREPARED):
+            raise ValueError("Each statement should be prepared once, under "
+                             "its registry name.")
+        try:
+            t.reportMatch(a, 0)
+        except ValueError:
+            pass
+        else:
+            raise ValueError("A prepared report should still reject players "
+                             "from elsewhere.")
+    with Tournament(prepare=False, cacheSize=0) as t:
+        if t.playerStandings() != standings or t.countPlayers() != count:
+            raise ValueError("Prepared and plain statements should agree.")
+    if standings != [(a, "Ace", 1, 2), (b, "Bea", 0, 2)]:
+        raise ValueError("A prepared report should record wins and draws.")
+    print "22. The hot statements are prepared once per pooled connection."
+
+
+def testTrackedAcrossClients():
+    deleteMatches()
+    deletePlayers()
+    [a, b, c, d] = registerPlayers(["Ace", "Bea", "Cid", "Dot"])
+    with Tournament(maxconn=2) as t:
+        model = t.trackStandings()
+        t.swissPairings()
+        # another client plays two rounds the tracked model never sees
+        reportMatches([(a, b), (c, d)], round=1)
+        reportMatches([(a, c), (b, d)], round=2)
+        pairs = t.swissPairings()
+        if pairs != swissPairings():
+            raise ValueError("A tracked handle should pair like a fresh "
+                             "client once someone else has written.")
+        if (set(frozenset((row[0], row[2])) for row in pairs) !=
+                set([frozenset((a, d)), frozenset((b, c))])):
+            raise ValueError("Nobody should be paired with a past opponent.")
+        e = registerPlayer("Eve")
+        if (set(row[0] for row in t.swissPairings()) |
+                set(row[2] for row in t.swissPairings())) != set([a, b, c, d,
+                                                                  e, None]):
+            raise ValueError("A player registered elsewhere should be paired "
+                             "or given the bye.")
+        if t.trackStandings() is model:
+            raise ValueError("A model behind the database should be replaced.")
+        model = t.trackStandings()
+        t.reportMatch(a, e, round=3)
+        if t.trackStandings() is not model:
+            raise ValueError("The handle's own writes should keep a current "
+                             "model tracked.")
+    print "23. Tracked standings give way to writes from other clients."
+
 if __name__ == '__main__':
     testDeleteMatches()
     testDelete()
@@ -134,4 +583,19 @@ if __name__ == '__main__':
     testStandingsBeforeMatches()
     testReportMatches()
     testPairings()
+    testPooledHandle()
+    testReportMatchesBatch()
+    testRegisterPlayersBulk()
+    testIndexedHistory()
+    testSeparateTournaments()
+    testTrackedStandings()
+    testTiebreaks()
+    testSnapshotCache()
+    testRatings()
+    testStreamingExport()
+    testInstrumentation()
+    testByesAndDraws()
+    testEventLog()
+    testPreparedStatements()
+    testTrackedAcrossClients()
     print "Success!  All tests pass!"
\ No newline at end of file